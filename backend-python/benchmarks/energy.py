@@ -0,0 +1,157 @@
+"""Benchmark of the patient-panel BMR/TEE estimates (GET /api/patients/energy).
+
+Times the vectorized energy_estimates() plus JSON encoding against a
+per-patient scalar loop computing the same formulas, and checks that both
+agree. With --mongo-url it also times the whole endpoint, projection
+fetch included, against a seeded nutritionist.
+
+    python benchmarks/energy.py [--sizes 1000,10000,100000]
+    python benchmarks/energy.py --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+TODAY = "2026-01-01"
+SEXES = ["F", "M", "feminino", "masculino", "female", "male", None]
+
+
+def make_patient(rng: random.Random) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "ownerId": "owner",
+        "name": f"Patient {rng.randrange(10**6)}",
+        "email": f"p{rng.randrange(10**9)}@bench.dinutri.app",
+        "birthDate": f"{rng.randint(1940, 2015)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "sex": rng.choice(SEXES),
+        "heightCm": rng.choice([None, round(rng.uniform(140, 200), 1)]) if rng.random() < 0.05 else round(rng.uniform(140, 200), 1),
+        "weightKg": round(rng.uniform(40, 130), 1),
+        "createdAt": server.now_iso(),
+        "updatedAt": server.now_iso(),
+    }
+
+
+def scalar_estimates(docs: list, factor: float, today: str) -> list:
+    """The same formulas and rows one patient at a time, as a reference."""
+    t = date.fromisoformat(today)
+    out = []
+    for d in docs:
+        w, h, initial = d.get("weightKg"), d.get("heightCm"), (d.get("sex") or "")[:1].lower()
+        try:
+            b = date.fromisoformat(d["birthDate"][:10])
+            age = (t.year - b.year) - ((t.month, t.day) < (b.month, b.day))
+        except (KeyError, TypeError, ValueError):
+            age = None
+        sex = {"m": "male", "f": "female"}.get(initial)
+        missing = [f for f, bad in (
+            ("weightKg", not (w and w > 0)),
+            ("heightCm", not (h and h > 0)),
+            ("birthDate", age is None or not 0 <= age < 130),
+            ("sex", sex is None),
+        ) if bad]
+        bmr_m = bmr_h = tee_m = tee_h = None
+        if not missing:
+            if sex == "male":
+                m, hb = 10 * w + 6.25 * h - 5 * age + 5, 88.362 + 13.397 * w + 4.799 * h - 5.677 * age
+            else:
+                m, hb = 10 * w + 6.25 * h - 5 * age - 161, 447.593 + 9.247 * w + 3.098 * h - 4.330 * age
+            bmr_m, bmr_h, tee_m, tee_h = round(m), round(hb), round(m * factor), round(hb * factor)
+        out.append({
+            "patientId": d.get("id"),
+            "name": d.get("name"),
+            "ageYears": None if "birthDate" in missing else age,
+            "sex": sex,
+            "bmr": {"mifflinStJeor": bmr_m, "harrisBenedict": bmr_h},
+            "tee": {"mifflinStJeor": tee_m, "harrisBenedict": tee_h},
+            "missing": missing,
+        })
+    return out
+
+
+def timed(fn, rounds: int) -> tuple:
+    result = fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    return (time.perf_counter() - start) / rounds * 1000, result
+
+
+def check(vectorized: list, reference: list) -> int:
+    """Rows that differ, allowing 1 kcal for rounding and a day for leap years."""
+    mismatches = 0
+    for got, ref in zip(vectorized, reference):
+        if got == ref:
+            continue
+        close = got["missing"] == ref["missing"] and all(
+            (a is None) == (b is None) and (a is None or abs(a - b) <= 1)
+            for a, b in zip(
+                [got["ageYears"], *got["bmr"].values(), *got["tee"].values()],
+                [ref["ageYears"], *ref["bmr"].values(), *ref["tee"].values()],
+            )
+        )
+        mismatches += not close
+    return mismatches
+
+
+async def endpoint_ms(mongo_url: str, docs: list, rounds: int) -> float:
+    import httpx
+
+    name = f"dinutri_bench_energy_{uuid.uuid4().hex[:8]}"
+    client = server.connect(server.Settings(mongo_url=mongo_url, db_name=name))
+    previous = server.db.use(client[name])
+    try:
+        await server.ensure_indexes()
+        owner = {"id": str(uuid.uuid4()), "role": "nutritionist", "name": "Bench", "email": "energy@bench.dinutri.app",
+                 "passwordHash": server.get_password_hash("password123"), "createdAt": server.now_iso(), "updatedAt": server.now_iso()}
+        await server.db.users.insert_one(owner)
+        await server.db.patients.insert_many([{**d, "ownerId": owner["id"]} for d in docs])
+        headers = {"Authorization": f"Bearer {server.create_access_token({'sub': owner['id'], 'role': 'nutritionist'})}"}
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as cl:
+            await cl.get("/api/patients/energy", headers=headers)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                r = await cl.get("/api/patients/energy", headers=headers)
+                r.raise_for_status()
+            return (time.perf_counter() - start) / rounds * 1000
+    finally:
+        await client.drop_database(name)
+        client.close()
+        server.db.use(previous)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--mongo-url", help="also time the endpoint end to end against this mongod")
+    args = parser.parse_args()
+    rng = random.Random(23)
+    factor = server.ACTIVITY_FACTORS["moderate"]
+
+    header = f"{'patients':>10}{'vectorized ms':>15}{'with json ms':>14}{'scalar ms':>11}{'speedup':>9}{'mismatch':>10}"
+    if args.mongo_url:
+        header += f"{'endpoint ms':>13}"
+    print(header)
+    for n in (int(x) for x in args.sizes.split(",")):
+        docs = [make_patient(rng) for _ in range(n)]
+        vec_ms, rows = timed(lambda: server.energy_estimates(docs, factor, TODAY), args.rounds)
+        json_ms, _ = timed(lambda: server.json_bytes(server.energy_estimates(docs, factor, TODAY)), args.rounds)
+        ref_ms, ref = timed(lambda: scalar_estimates(docs, factor, TODAY), args.rounds)
+        line = f"{n:>10,}{vec_ms:>15.1f}{json_ms:>14.1f}{ref_ms:>11.1f}{ref_ms / vec_ms:>8.1f}x{check(rows, ref):>10}"
+        if args.mongo_url:
+            line += f"{asyncio.run(endpoint_ms(args.mongo_url, docs, args.rounds)):>13.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
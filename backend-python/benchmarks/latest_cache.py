@@ -0,0 +1,101 @@
+"""Benchmark of the latest-published-plan cache under concurrent load.
+
+Simulates many clients polling latest_published for a pool of patients
+against a loader with a fixed round-trip latency, and compares going to
+the database on every call with SingleFlightCache (LRU + TTL + coalesced
+misses). Writes invalidate random patients to keep misses realistic.
+
+    python benchmarks/latest_cache.py [--clients 200] [--requests 20000]
+
+No database is needed; the loader only sleeps.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+import server  # noqa: E402
+
+
+def make_loader(latency: float):
+    calls = 0
+
+    async def loader(patient_id: str):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(latency)
+        return "owner", {"id": f"plan-{patient_id}", "patientId": patient_id}
+
+    loader.calls = lambda: calls
+    return loader
+
+
+async def run(get, args) -> dict:
+    patients = [f"p{i}" for i in range(args.patients)]
+    # Skewed popularity: a few patients are polled far more than the rest
+    weights = [1 / (i + 1) for i in range(args.patients)]
+    latencies = []
+    remaining = args.requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            patient_id = random.choices(patients, weights)[0]
+            start = time.perf_counter()
+            await get(patient_id)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)  # yield like a real request would
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+async def main(args):
+    random.seed(1)
+    direct = make_loader(args.latency)
+    baseline = await run(direct, args)
+
+    cached_loader = make_loader(args.latency)
+    cache = server.SingleFlightCache(cached_loader, args.max_entries, ttl=args.ttl)
+
+    async def writer():
+        while True:
+            await asyncio.sleep(args.write_interval)
+            cache.invalidate(f"p{random.randrange(args.patients)}")
+
+    writes = asyncio.create_task(writer())
+    cached = await run(cache.get, args)
+    writes.cancel()
+
+    print(f"{'mode':<10}{'req/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'db loads':>10}")
+    print(f"{'direct':<10}{baseline['rps']:>12,.0f}{baseline['p50']:>10.2f}{baseline['p95']:>10.2f}{direct.calls():>10}")
+    print(f"{'cached':<10}{cached['rps']:>12,.0f}{cached['p50']:>10.2f}{cached['p95']:>10.2f}{cached_loader.calls():>10}")
+    stats = cache.stats()
+    print(f"ttl {args.ttl:g} s, hit ratio {stats['hitRatio']:.3f}, coalesced {stats['coalesced']}, evictions {stats['evictions']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--max-entries", type=int, default=1000)
+    parser.add_argument("--ttl", type=float, default=server.LATEST_CACHE_TTL_SECONDS, help="seconds, LATEST_CACHE_TTL_SECONDS by default")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated DB round trip, seconds")
+    parser.add_argument("--write-interval", type=float, default=0.01, help="seconds between invalidations")
+    asyncio.run(main(parser.parse_args()))
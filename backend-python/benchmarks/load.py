@@ -0,0 +1,341 @@
+"""Async load test of the API, driven in-process through httpx's ASGI transport.
+
+Seeds nutritionists, patients and multi-meal prescriptions, then fires
+concurrent requests at each route and reports requests/sec and
+p50/p95/p99 latency. Routes listed in the baseline file fail the run
+when p95 or throughput regress past the tolerance.
+
+    python benchmarks/load.py                                # in-memory stand-in
+    python benchmarks/load.py --mongo-url mongodb://localhost:27017
+    python benchmarks/load.py --write-baseline               # record a new baseline
+
+The in-memory stand-in needs mongomock-motor and is much slower than a
+real mongod. The baseline file keeps one entry per backend, each with the
+machine and settings it was recorded with; a run on another machine or
+with other settings is refused rather than compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+# Routes gated by the baseline; everything else is reported only
+GATED_ROUTES = ("login", "me", "list_prescriptions", "latest_published")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", help="run against this mongod instead of the in-memory stand-in")
+    parser.add_argument("--db-name", default="dinutri_bench", help="database to (re)create on --mongo-url")
+    parser.add_argument("--nutritionists", type=int, default=5)
+    parser.add_argument("--patients", type=int, default=100, help="per nutritionist")
+    parser.add_argument("--prescriptions", type=int, default=5, help="per patient")
+    parser.add_argument("--meals", type=int, default=6)
+    parser.add_argument("--items", type=int, default=8, help="per meal")
+    parser.add_argument("--heavy-prescriptions", type=int, default=200, help="plans of the one heavy patient")
+    parser.add_argument("--requests", type=int, default=400, help="per route")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--write-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression")
+    return parser.parse_args()
+
+
+def load_server(args):
+    import server
+
+    if args.mongo_url:
+        client = server.connect(server.Settings(mongo_url=args.mongo_url, db_name=args.db_name))
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("mongomock-motor is not installed; install it or pass --mongo-url")
+        client = AsyncMongoMockClient()
+    server.db.use(client[args.db_name])
+    return server
+
+
+def make_prescription(server, patient_id: str, owner_id: str, i: int, args) -> dict:
+    now = server.now_iso()
+    published = i % 2 == 0
+    return {
+        "id": str(uuid.uuid4()),
+        "patientId": patient_id,
+        "nutritionistId": owner_id,
+        "ownerId": owner_id,
+        "title": f"Plan {i}",
+        "status": "published" if published else "draft",
+        "meals": [
+            {
+                "id": str(uuid.uuid4()),
+                "name": f"Meal {m}",
+                "notes": None,
+                "items": [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "description": f"Food {m}.{k}",
+                        "amount": "100 g",
+                        "substitutions": ["Option A", "Option B"],
+                    }
+                    for k in range(args.items)
+                ],
+            }
+            for m in range(args.meals)
+        ],
+        "generalNotes": "Drink water",
+        "publishedAt": now if published else None,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+
+
+async def seed(server, args) -> dict:
+    db = server.db
+    if args.mongo_url:
+        await db.client.drop_database(args.db_name)
+        await server.ensure_indexes()
+    password_hash = server.get_password_hash("password123")
+    now = server.now_iso()
+    ctx = {"nutritionists": [], "patients": [], "prescriptions": []}
+    for n in range(args.nutritionists):
+        user = {
+            "id": str(uuid.uuid4()),
+            "role": "nutritionist",
+            "name": f"Nutritionist {n}",
+            "email": f"nutri{n}@bench.dinutri.app",
+            "passwordHash": password_hash,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        await db.users.insert_one(user)
+        patients = [
+            {
+                "id": str(uuid.uuid4()),
+                "ownerId": user["id"],
+                "name": f"Patient {n}.{i}",
+                "email": f"patient{n}.{i}@bench.dinutri.app",
+                "heightCm": 150 + i % 40,
+                "weightKg": 50 + i % 50,
+                "createdAt": server.now_iso(),
+                "updatedAt": server.now_iso(),
+            }
+            for i in range(args.patients)
+        ]
+        await db.patients.insert_many(patients)
+        plans = [
+            make_prescription(server, pt["id"], user["id"], i, args)
+            for pt in patients
+            for i in range(args.prescriptions)
+        ]
+        await db.prescriptions.insert_many(plans)
+        ctx["nutritionists"].append(user)
+        ctx["patients"] += [(user["id"], pt["id"]) for pt in patients]
+        ctx["prescriptions"] += [(user["id"], p["id"]) for p in plans]
+
+    owner = ctx["nutritionists"][0]
+    heavy = {
+        "id": str(uuid.uuid4()),
+        "ownerId": owner["id"],
+        "name": "Heavy patient",
+        "email": "heavy@bench.dinutri.app",
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    await db.patients.insert_one(heavy)
+    await db.prescriptions.insert_many(
+        [make_prescription(server, heavy["id"], owner["id"], i, args) for i in range(args.heavy_prescriptions)]
+    )
+    ctx["heavy"] = (owner["id"], heavy["id"])
+    return ctx
+
+
+class RouteStats:
+    def __init__(self, name: str, latencies: list, elapsed: float, errors: int, size: int):
+        latencies.sort()
+        self.name = name
+        self.count = len(latencies)
+        self.rps = self.count / elapsed if elapsed else 0.0
+        self.errors = errors
+        self.avg_bytes = size / self.count if self.count else 0
+        self.p50, self.p95, self.p99 = (self.percentile(latencies, q) for q in (0.50, 0.95, 0.99))
+
+    @staticmethod
+    def percentile(values: list, q: float) -> float:
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0.0
+
+
+async def measure(name: str, send, total: int, concurrency: int) -> RouteStats:
+    """Run send(i) total times with at most concurrency requests in flight."""
+    latencies, errors, size = [], 0, 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors, size
+        for i in counter:
+            start = time.perf_counter()
+            response = await send(i)
+            latencies.append(time.perf_counter() - start)
+            size += len(response.content)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return RouteStats(name, latencies, time.perf_counter() - start, errors, size)
+
+
+async def run(server, args) -> list:
+    import httpx
+
+    ctx = await seed(server, args)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tokens = {}
+        for user in ctx["nutritionists"]:
+            r = await client.post("/api/auth/login", data={"username": user["email"], "password": "password123"})
+            tokens[user["id"]] = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        owners = list(tokens)
+        heavy_owner, heavy_id = ctx["heavy"]
+        rng = random.Random(7)
+
+        def login(i):
+            user = ctx["nutritionists"][i % len(ctx["nutritionists"])]
+            return client.post("/api/auth/login", data={"username": user["email"], "password": "password123"})
+
+        def patient_get(path):
+            def send(i):
+                owner, patient_id = rng.choice(ctx["patients"])
+                return client.get(path.format(patient_id), headers=tokens[owner])
+            return send
+
+        def get_prescription(i):
+            owner, prescription_id = rng.choice(ctx["prescriptions"])
+            return client.get(f"/api/prescriptions/{prescription_id}", headers=tokens[owner])
+
+        scenarios = [
+            ("login", login, max(20, args.requests // 10)),
+            ("me", lambda i: client.get("/api/me", headers=tokens[owners[i % len(owners)]]), args.requests),
+            ("list_patients", lambda i: client.get("/api/patients?limit=50", headers=tokens[owners[i % len(owners)]]), args.requests),
+            ("list_prescriptions", patient_get("/api/patients/{}/prescriptions"), args.requests),
+            ("latest_published", patient_get("/api/patients/{}/latest"), args.requests),
+            ("get_prescription", get_prescription, args.requests),
+            ("heavy_prescriptions_full",
+             lambda i: client.get(f"/api/patients/{heavy_id}/prescriptions", headers=tokens[heavy_owner]),
+             max(10, args.requests // 20)),
+            ("heavy_prescriptions_summary",
+             lambda i: client.get(f"/api/patients/{heavy_id}/prescriptions/summary", headers=tokens[heavy_owner]),
+             max(10, args.requests // 20)),
+        ]
+        # Logins as many at once as there are bcrypt workers, so the baseline has
+        # the cost of a login rather than the length of the queue (see login_burst)
+        concurrency = {"login": min(args.concurrency, server.PASSWORD_HASH_WORKERS)}
+        results = [await measure(name, send, n, concurrency.get(name, args.concurrency)) for name, send, n in scenarios]
+
+        # /me latency while a burst of logins keeps the bcrypt pool busy
+        burst = asyncio.create_task(measure("login_burst", login, max(20, args.requests // 10), args.concurrency))
+        results.append(await measure(
+            "me_during_login_burst",
+            lambda i: client.get("/api/me", headers=tokens[owners[i % len(owners)]]),
+            args.requests,
+            max(1, args.concurrency // 4),
+        ))
+        results.append(await burst)
+    return results
+
+
+def report(results: list):
+    print(f"{'route':<30}{'reqs':>7}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'avg bytes':>11}{'errors':>8}")
+    for r in results:
+        print(f"{r.name:<30}{r.count:>7}{r.rps:>10,.0f}{r.p50:>9.2f}{r.p95:>9.2f}{r.p99:>9.2f}{r.avg_bytes:>11,.0f}{r.errors:>8}")
+
+
+def environment(server, args) -> dict:
+    """What a baseline was recorded with; runs are only compared when this matches."""
+    return {
+        "backend": "mongod" if args.mongo_url else "in-memory",
+        "machine": {
+            "system": platform.system(),
+            "arch": platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "settings": {
+            **{k: getattr(args, k) for k in ("nutritionists", "patients", "prescriptions", "meals", "items",
+                                             "heavy_prescriptions", "requests", "concurrency")},
+            "password_hash_workers": server.PASSWORD_HASH_WORKERS,
+        },
+    }
+
+
+def baseline_mismatch(entry: dict, env: dict) -> list:
+    return [f"{key}: baseline {entry.get(key)}, this run {env[key]}"
+            for key in ("machine", "settings") if entry.get(key) != env[key]]
+
+
+def check_baseline(results: list, entry: dict, tolerance: float) -> list:
+    by_name = {r.name: r for r in results}
+    failures = []
+    for name, expected in entry.get("routes", {}).items():
+        r = by_name.get(name)
+        if r is None:
+            continue
+        if r.p95 > expected["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {r.p95:.2f} ms > baseline {expected['p95_ms']:.2f} ms")
+        if r.rps < expected["rps"] / (1 + tolerance):
+            failures.append(f"{name}: {r.rps:,.0f} req/s < baseline {expected['rps']:,.0f} req/s")
+        if r.errors:
+            failures.append(f"{name}: {r.errors} error responses")
+    return failures
+
+
+def write_baseline(results: list, path: Path, env: dict):
+    """Record this run as the baseline of its backend, keeping the others."""
+    baselines = json.loads(path.read_text()) if path.exists() else {}
+    baselines[env["backend"]] = {
+        "machine": env["machine"],
+        "settings": env["settings"],
+        "routes": {
+            r.name: {"p95_ms": round(r.p95, 2), "rps": round(r.rps, 1)}
+            for r in results if r.name in GATED_ROUTES
+        },
+    }
+    path.write_text(json.dumps(baselines, indent=2) + "\n")
+    print(f"{env['backend']} baseline written to {path}")
+
+
+def main():
+    args = parse_args()
+    server = load_server(args)
+    results = asyncio.run(run(server, args))
+    report(results)
+    env = environment(server, args)
+    if args.write_baseline:
+        write_baseline(results, args.baseline, env)
+        return
+    entry = json.loads(args.baseline.read_text()).get(env["backend"]) if args.baseline.exists() else None
+    if entry is None:
+        print(f"No {env['backend']} baseline in {args.baseline}; run with --write-baseline to record one")
+        return
+    mismatch = baseline_mismatch(entry, env)
+    if mismatch:
+        for line in mismatch:
+            print(f"NOT COMPARABLE {line}")
+        sys.exit("Not comparing against a baseline from another machine or settings; rerun with its settings or --write-baseline")
+    failures = check_baseline(results, entry, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
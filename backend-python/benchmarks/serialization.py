@@ -0,0 +1,132 @@
+"""Micro-benchmark of response serialization for the read-heavy routes.
+
+Compares the default path (build a model per document, then let FastAPI
+validate and encode the result against response_model) with the
+FAST_RESPONSES path (shape trusted documents and encode them directly).
+
+    python benchmarks/serialization.py [--rounds 20]
+
+No database is needed; documents are generated in memory.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+from fastapi.routing import serialize_response  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+import server  # noqa: E402
+
+NOW = "2024-01-01T00:00:00+00:00"
+
+
+def make_patient(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "ownerId": "owner",
+        "name": f"Patient {i}",
+        "email": f"patient{i}@example.com",
+        "birthDate": "1990-01-01",
+        "sex": "F",
+        "heightCm": 165.0,
+        "weightKg": 60.5,
+        "phone": "+55 11 99999-0000",
+        "notes": "Lactose intolerant",
+        "createdAt": NOW,
+        "updatedAt": NOW,
+    }
+
+
+def make_prescription(i: int, meals: int = 6, items: int = 8) -> dict:
+    """A plan as create_prescription stores it, every nested field present."""
+    return {
+        "id": str(uuid.uuid4()),
+        "patientId": "patient",
+        "nutritionistId": "owner",
+        "ownerId": "owner",
+        "title": f"Plan {i}",
+        "status": "published",
+        "meals": [
+            {
+                "id": str(uuid.uuid4()),
+                "name": f"Meal {m}",
+                "notes": None,
+                "items": [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "description": f"Food {m}.{k}",
+                        "amount": "100 g",
+                        "substitutions": ["Option A", "Option B"],
+                    }
+                    for k in range(items)
+                ],
+            }
+            for m in range(meals)
+        ],
+        "generalNotes": "Drink water",
+        "publishedAt": NOW,
+        "createdAt": NOW,
+        "updatedAt": NOW,
+    }
+
+
+def make_sparse_prescription(i: int) -> dict:
+    """A plan as update_prescription stores it: nested None fields left out."""
+    doc = make_prescription(i)
+    for meal in doc["meals"]:
+        del meal["notes"]
+        for item in meal["items"]:
+            del item["substitutions"]
+    return doc
+
+
+def route_field(name: str):
+    return next(r for r in server.app.routes if getattr(r, "name", None) == name).response_field
+
+
+async def default_path(model, field, docs) -> bytes:
+    content = [model(**server.to_doc_id(d)) for d in server.with_derived(model, docs)]
+    value = await serialize_response(field=field, response_content=content)
+    return JSONResponse(value).body
+
+
+async def fast_path(model, field, docs) -> bytes:
+    return server.fast_json(server.trusted_docs(model, docs)).body
+
+
+async def bench(fn, model, field, docs, rounds: int) -> tuple:
+    await fn(model, field, docs)  # warm-up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        body = await fn(model, field, docs)
+    elapsed = time.perf_counter() - start
+    return rounds * len(docs) / elapsed, len(body)
+
+
+async def main(rounds: int):
+    cases = [
+        ("PatientOut x1000", server.PatientOut, route_field("list_patients"), [make_patient(i) for i in range(1000)]),
+        ("PrescriptionOut x200", server.PrescriptionOut, route_field("list_prescriptions"), [make_prescription(i) for i in range(200)]),
+        ("sparse PrescriptionOut x200", server.PrescriptionOut, route_field("list_prescriptions"),
+         [make_sparse_prescription(i) for i in range(200)]),
+    ]
+    print(f"{'case':<30}{'default docs/s':>16}{'fast docs/s':>14}{'speedup':>10}{'bytes':>12}")
+    for label, model, field, docs in cases:
+        if await default_path(model, field, docs) != await fast_path(model, field, docs):
+            sys.exit(f"{label}: FAST_RESPONSES output differs from the default path")
+        slow, size = await bench(default_path, model, field, docs, rounds)
+        fast, _ = await bench(fast_path, model, field, docs, rounds)
+        print(f"{label:<30}{slow:>16,.0f}{fast:>14,.0f}{fast / slow:>9.1f}x{size:>12,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    asyncio.run(main(parser.parse_args().rounds))
@@ -0,0 +1,155 @@
+"""Throughput of the API as uvicorn workers go from 1 to N.
+
+Starts `uvicorn server:app --workers N` for each worker count, sharing one
+JWT keyring, logs in once and hammers an authenticated route from several
+client processes. A token issued by one worker must verify on all the
+others, so any 401 means the signing key is not shared.
+
+    python benchmarks/workers.py --mongo-url mongodb://localhost:27017
+    python benchmarks/workers.py --mongo-url ... --workers 1,2,4,8 --route /api/patients
+
+Workers need a real mongod (the in-memory stand-in is per process). The
+load clients share the machine with the server, so leave cores for them
+or point --clients at fewer processes than you have cores.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def parse_args():
+    cpus = os.cpu_count() or 1
+    default_workers = [1]
+    while default_workers[-1] * 2 <= max(1, cpus // 2):
+        default_workers.append(default_workers[-1] * 2)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", required=True)
+    parser.add_argument("--db-name", default="dinutri_bench_workers")
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)), help="comma-separated counts")
+    parser.add_argument("--route", default="/api/me")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    parser.add_argument("--clients", type=int, default=max(1, cpus // 2), help="load-generating processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per client process")
+    parser.add_argument("--port", type=int, default=8765)
+    return parser.parse_args()
+
+
+def write_keyring() -> str:
+    fd, path = tempfile.mkstemp(prefix="dinutri-keyring-", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"active": "bench", "keys": {"bench": secrets.token_urlsafe(48)}}, f)
+    return path
+
+
+def start_server(args, workers: int, keyring: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MONGO_URL": args.mongo_url,
+        "DB_NAME": args.db_name,
+        "JWT_KEYRING_FILE": keyring,
+        "WEB_CONCURRENCY": str(workers),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"server exited with status {proc.returncode}")
+        try:
+            if httpx.get(f"{base_url}/api/").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    sys.exit("server did not come up in time")
+
+
+async def _hammer(url: str, headers: dict, duration: float, concurrency: int) -> tuple:
+    import httpx
+
+    ok = unauthorized = errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal ok, unauthorized, errors
+            while time.monotonic() < deadline:
+                try:
+                    r = await client.get(url, headers=headers)
+                except httpx.TransportError:
+                    errors += 1
+                    continue
+                if r.status_code == 401:
+                    unauthorized += 1
+                elif r.status_code >= 400:
+                    errors += 1
+                else:
+                    ok += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return ok, unauthorized, errors
+
+
+def run_client(job: tuple) -> tuple:
+    return asyncio.run(_hammer(*job))
+
+
+def measure(args, workers: int, keyring: str) -> dict:
+    import httpx
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    proc = start_server(args, workers, keyring)
+    try:
+        wait_ready(base_url, proc)
+        r = httpx.post(f"{base_url}/api/auth/login", data={"username": "pro@dinutri.app", "password": "password123"})
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        job = (base_url + args.route, headers, args.duration, args.concurrency)
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(run_client, [job] * args.clients)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    ok, unauthorized, errors = (sum(col) for col in zip(*results))
+    return {"workers": workers, "rps": ok / args.duration, "unauthorized": unauthorized, "errors": errors}
+
+
+def main():
+    args = parse_args()
+    counts = [int(n) for n in args.workers.split(",")]
+    keyring = write_keyring()
+    try:
+        rows = [measure(args, n, keyring) for n in counts]
+    finally:
+        os.unlink(keyring)
+    base = rows[0]["rps"] or 1.0
+    print(f"{'workers':>8}{'req/s':>12}{'speedup':>10}{'per worker':>12}{'401s':>8}{'errors':>8}")
+    for row in rows:
+        speedup = row["rps"] / base
+        print(f"{row['workers']:>8}{row['rps']:>12,.0f}{speedup:>9.2f}x{speedup / row['workers']:>11.0%}"
+              f"{row['unauthorized']:>8}{row['errors']:>8}")
+    if any(row["unauthorized"] for row in rows):
+        sys.exit("tokens were rejected by some workers; the signing key is not shared")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,45 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Match
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Literal, Dict, Any
+from pydantic import BaseModel, Field, EmailStr, ValidationError
+from typing import List, Optional, Literal, Dict, Any, Generic, TypeVar, Union, Tuple, get_args, get_origin
 import uuid
+import json
+import asyncio
+import time
+import base64
+import hashlib
+import csv
+import codecs
+import zlib
+import bisect
+import contextvars
+import functools
+import re
+import unicodedata
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 import jwt
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - fall back to the stdlib encoder
+    orjson = None
 
 # ----------------------------------------------------------------------------
 # Load env
@@ -23,35 +51,535 @@ MONGO_URL = os.environ.get('MONGO_URL')
 DB_NAME = os.environ.get('DB_NAME', 'dinutri_db')
 JWT_ALGO = 'HS256'
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def env_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+USER_CACHE_ENABLED = env_flag('USER_CACHE_ENABLED', True)
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '10000'))
+# Trust role/patientId claims in the JWT for role-only checks (no DB read).
+# A deleted user keeps working until the token expires when this is on.
+TRUST_JWT_CLAIMS = env_flag('TRUST_JWT_CLAIMS')
+
+# bcrypt runs on a dedicated pool so it never blocks the event loop
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait or run at once before new ones get a 503
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '256'))
+
+# How often the background sweeper marks past-due invites as expired
+INVITE_SWEEP_INTERVAL_SECONDS = float(os.environ.get('INVITE_SWEEP_INTERVAL_SECONDS', '60'))
+
+# Serve read-heavy routes straight from trusted DB documents, skipping the
+# per-document model build and FastAPI's second response_model validation
+FAST_RESPONSES = env_flag('FAST_RESPONSES')
+
+# Bulk patient import: rows validated and inserted per chunk
+BULK_IMPORT_CHUNK_SIZE = int(os.environ.get('BULK_IMPORT_CHUNK_SIZE', '500'))
+BULK_IMPORT_MAX_ERRORS = int(os.environ.get('BULK_IMPORT_MAX_ERRORS', '1000'))
+# Longest CSV record (quoted fields may span lines) held while looking for its end
+BULK_IMPORT_MAX_RECORD_CHARS = int(os.environ.get('BULK_IMPORT_MAX_RECORD_CHARS', '65536'))
+
+# Streaming export: Mongo cursor batch size and bytes buffered per chunk
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+
+# Most patients a single plan can be copied to in one request
+FANOUT_MAX_PATIENTS = int(os.environ.get('FANOUT_MAX_PATIENTS', '1000'))
+
+# Food-composition table: TACO/USDA-style CSV, nutrients per 100 g
+FOODS_CSV = os.environ.get('FOODS_CSV', str(ROOT_DIR / 'data' / 'foods.csv'))
+# Nutrient totals are cached per prescription id + updatedAt
+NUTRIENT_CACHE_MAX_ENTRIES = int(os.environ.get('NUTRIENT_CACHE_MAX_ENTRIES', '20000'))
+# Most prescriptions one POST /prescriptions/totals call may ask for
+TOTALS_BATCH_MAX = int(os.environ.get('TOTALS_BATCH_MAX', '500'))
+
+# Most matching documents per collection GET /search ranks; beyond that a
+# very broad query is ranked on the first ones found
+SEARCH_CANDIDATES_MAX = int(os.environ.get('SEARCH_CANDIDATES_MAX', '500'))
+
+# Latest published plan per patient, the most polled read. Invalidation is
+# in-process only, so with several workers the TTL is how long another
+# worker may keep serving (or 304-ing) the previous plan after a publish:
+# keep it to a few seconds, enough to absorb a burst of polls.
+LATEST_CACHE_ENABLED = env_flag('LATEST_CACHE_ENABLED', True)
+LATEST_CACHE_TTL_SECONDS = float(os.environ.get('LATEST_CACHE_TTL_SECONDS', '2'))
+LATEST_CACHE_MAX_ENTRIES = int(os.environ.get('LATEST_CACHE_MAX_ENTRIES', '10000'))
+
+# Server-Sent Events for published plans
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_HISTORY_SIZE = int(os.environ.get('SSE_HISTORY_SIZE', '1000'))
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', '16'))
+# Lifetime of the stream tokens EventSource sends as ?access_token=; URLs end
+# up in access logs, so these only open one patient's stream and expire fast
+SSE_TOKEN_TTL_SECONDS = int(os.environ.get('SSE_TOKEN_TTL_SECONDS', '120'))
+
+# When set, startup fails if a hot query is not served by an index
+INDEX_STRICT = env_flag('INDEX_STRICT')
+
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Requests that issue more Mongo commands than their route's @query_budget
+# are logged and counted; when set they raise instead (used by the tests)
+QUERY_BUDGET_STRICT = env_flag('QUERY_BUDGET_STRICT')
+
+# JWT signing keys shared by every worker, as a JSON file:
+#   {"active": "2024-06", "keys": {"2024-06": "<secret>", "2024-01": "<secret>"}}
+# Tokens are signed with the active key and carry its id in the "kid" header;
+# every listed key still verifies, so rotate by adding a key, making it
+# active, and dropping the old one once its tokens have expired. The file is
+# re-read when it changes, checked at most every JWT_KEYRING_RELOAD_SECONDS.
+JWT_KEYRING_FILE = os.environ.get('JWT_KEYRING_FILE')
+JWT_KEYRING_RELOAD_SECONDS = float(os.environ.get('JWT_KEYRING_RELOAD_SECONDS', '10'))
+# Development only: with neither JWT_SECRET nor JWT_KEYRING_FILE, sign with a
+# random per-process secret. Its tokens die with the process and fail on every
+# other worker (uvicorn --workers / gunicorn -w do not always set
+# WEB_CONCURRENCY), so startup refuses that fallback unless this is set.
+JWT_ALLOW_RANDOM_SECRET = env_flag('JWT_ALLOW_RANDOM_SECRET')
+# Worker processes uvicorn/gunicorn start (both read WEB_CONCURRENCY)
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))
+
+# Motor connection pool, per worker process. MONGO_MIN_POOL_SIZE connections
+# are opened during startup so the first requests skip the TCP/TLS/auth
+# handshake; a request waits at most MONGO_WAIT_QUEUE_TIMEOUT_MS for a free one.
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+
+# /readyz reports unavailable when a Mongo ping takes longer than this
+READY_PING_TIMEOUT_SECONDS = float(os.environ.get('READY_PING_TIMEOUT_SECONDS', '2'))
+
+
+class Settings(BaseModel):
+    """What create_app needs to connect and serve; defaults come from the environment."""
+    mongo_url: Optional[str] = MONGO_URL
+    db_name: str = DB_NAME
+    cors_origins: List[str] = os.environ.get('CORS_ORIGINS', '*').split(',')
+    mongo_max_pool_size: int = MONGO_MAX_POOL_SIZE
+    mongo_min_pool_size: int = MONGO_MIN_POOL_SIZE
+    mongo_connect_timeout_ms: int = MONGO_CONNECT_TIMEOUT_MS
+    mongo_server_selection_timeout_ms: int = MONGO_SERVER_SELECTION_TIMEOUT_MS
+    mongo_wait_queue_timeout_ms: int = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    web_concurrency: int = WEB_CONCURRENCY
+
+    def check(self) -> None:
+        if not self.mongo_url:
+            raise RuntimeError("MONGO_URL must be set in backend/.env")
+        if not (JWT_KEYRING_FILE or os.environ.get('JWT_SECRET')):
+            if not JWT_ALLOW_RANDOM_SECRET:
+                raise RuntimeError(
+                    "Set JWT_SECRET or JWT_KEYRING_FILE (JWT_ALLOW_RANDOM_SECRET=1 allows a random "
+                    "per-process secret for a single-process development server)"
+                )
+            if self.web_concurrency > 1:
+                raise RuntimeError("A random JWT secret cannot be shared by several workers; set JWT_SECRET or JWT_KEYRING_FILE")
+
+# ----------------------------------------------------------------------------
+# Metrics
+# ----------------------------------------------------------------------------
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_COMMANDS_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RequestDbStats:
+    """DB round trips made while serving one request."""
+    __slots__ = ("commands", "seconds")
+
+    def __init__(self):
+        self.commands = 0
+        self.seconds = 0.0
+
 
-if not MONGO_URL:
-    raise RuntimeError("MONGO_URL must be set in backend/.env")
+current_request_db = contextvars.ContextVar("current_request_db", default=None)
 
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
 
-# Use a single in-memory secret for the app lifetime if JWT_SECRET is not provided
-SECRET = os.environ.get('JWT_SECRET') or str(uuid.uuid4())
+class CommandMetrics(monitoring.CommandListener):
+    """Counts Mongo commands by name and charges them to the current request.
+
+    pymongo calls listeners on the thread that ran the command; Motor runs
+    each command in a copy of the caller's context, so that thread still
+    sees the request's stats. Those threads run concurrently, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_command: Dict[str, List[float]] = {}
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event.command_name, event.duration_micros, False)
+
+    def failed(self, event):
+        self._record(event.command_name, event.duration_micros, True)
+
+    def _record(self, command: str, duration_micros: int, failed: bool) -> None:
+        seconds = duration_micros / 1e6
+        stats = current_request_db.get()
+        with self._lock:
+            entry = self.by_command.setdefault(command, [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += failed
+            entry[2] += seconds
+            if stats is not None:
+                stats.commands += 1
+                stats.seconds += seconds
+
+    def snapshot(self) -> List[Tuple[str, List[float]]]:
+        with self._lock:
+            return sorted((command, list(entry)) for command, entry in self.by_command.items())
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Pooled Mongo connections open, checked out and waited for, summed over servers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.max_pool_size = MONGO_MAX_POOL_SIZE
+        self.open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.checkout_timeouts = 0
+
+    def _add(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(open=-1)
+
+    def connection_check_out_started(self, event):
+        self._add(waiting=1)
+
+    def connection_check_out_failed(self, event):
+        timed_out = event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT
+        self._add(waiting=-1, checkout_timeouts=int(timed_out))
+
+    def connection_checked_out(self, event):
+        self._add(waiting=-1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._add(in_use=-1)
+
+    def stats(self) -> Dict[str, Any]:
+        # maxPoolSize applies per server, so saturation is exact against a
+        # single primary and an upper bound when secondaries are read too
+        return {
+            "open": self.open,
+            "inUse": self.in_use,
+            "waiting": self.waiting,
+            "maxPoolSize": self.max_pool_size,
+            "saturation": round(self.in_use / self.max_pool_size, 3) if self.max_pool_size else 0.0,
+            "checkoutTimeouts": self.checkout_timeouts,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.db_commands: Dict[Tuple[str, str], Histogram] = {}
+        self.db_seconds: Dict[Tuple[str, str], float] = {}
+        self.budget_exceeded: Dict[Tuple[str, str], int] = {}
+
+    def record(self, key: Tuple[str, str], status_code: int, seconds: float, db_stats: RequestDbStats) -> None:
+        rkey = (*key, status_code)
+        self.responses[rkey] = self.responses.get(rkey, 0) + 1
+        if key not in self.latency:
+            self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.db_commands[key] = Histogram(DB_COMMANDS_BUCKETS)
+            self.db_seconds[key] = 0.0
+        self.latency[key].observe(seconds)
+        self.db_commands[key].observe(db_stats.commands)
+        self.db_seconds[key] += db_stats.seconds
+
+
+metrics = MetricsRegistry()
+command_metrics = CommandMetrics()
+pool_metrics = PoolMetrics()
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(max_commands: int):
+    """Declare the most Mongo round trips (getMore included) one request to a
+    route may make, whatever the size of the data behind it."""
+    def decorator(endpoint):
+        endpoint.query_budget = max_commands
+        return endpoint
+    return decorator
+
+
+def match_route(scope):
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, status, in-flight and DB use per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = match_route(scope)
+        # Label by path template, to keep label cardinality bounded
+        key = (scope["method"], route.path if route else "unmatched")
+        budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+        metrics.in_flight[key] = metrics.in_flight.get(key, 0) + 1
+        db_stats = RequestDbStats()
+        token = current_request_db.set(db_stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.record(key, status_code, time.perf_counter() - start, db_stats)
+            metrics.in_flight[key] -= 1
+            current_request_db.reset(token)
+        if budget is not None and db_stats.commands > budget:
+            metrics.budget_exceeded[key] = metrics.budget_exceeded.get(key, 0) + 1
+            message = f"{key[0]} {key[1]} made {db_stats.commands} Mongo round trips, budget is {budget}"
+            if QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+def connect(settings: Settings) -> AsyncIOMotorClient:
+    pool_metrics.max_pool_size = settings.mongo_max_pool_size
+    return AsyncIOMotorClient(
+        settings.mongo_url,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        connectTimeoutMS=settings.mongo_connect_timeout_ms,
+        serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+        waitQueueTimeoutMS=settings.mongo_wait_queue_timeout_ms,
+        event_listeners=[command_metrics, pool_metrics],
+    )
+
+
+# The database of the app serving the current request or running the current
+# lifespan (and the background tasks it started)
+current_app_db = contextvars.ContextVar("current_app_db", default=None)
+
+
+class AppDatabase:
+    """Stands in for the Motor database of whichever app is in context.
+
+    Each app keeps its own client and database on app.state; DatabaseMiddleware
+    binds them for every request and the lifespan for startup work and
+    background tasks, so several apps in one process never share (or close)
+    each other's connections. Code running outside any app, like tests and
+    benchmarks calling helpers directly, uses the database given to use().
+    """
+
+    def __init__(self):
+        self._fallback = None
+
+    def use(self, database):
+        """Set the database used outside any app; returns the previous one."""
+        previous, self._fallback = self._fallback, database
+        return previous
+
+    def current(self):
+        database = current_app_db.get()
+        if database is None:
+            database = self._fallback
+        if database is None:
+            raise RuntimeError("No database: the app has not started and none was set with db.use()")
+        return database
+
+    def __getattr__(self, name: str):
+        return getattr(self.current(), name)
+
+    def __getitem__(self, name: str):
+        return self.current()[name]
+
+
+db = AppDatabase()
+
+# The caches, password hash pool and plan event broker (AppServices) of the
+# app in context, bound alongside its database
+current_app_services = contextvars.ContextVar("current_app_services", default=None)
+
+
+class AppScoped:
+    """Stands in for one of the AppServices of whichever app is in context.
+
+    Outside any app it is the one in default_services, which the module-level
+    app also uses, so tests and benchmarks see what that app's requests do.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def current(self):
+        services = current_app_services.get() or default_services
+        return getattr(services, self._name)
+
+    def __getattr__(self, name: str):
+        return getattr(self.current(), name)
+
+
+class DatabaseMiddleware:
+    """Binds the serving app's database (app.state.db) and services for the request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.app(scope, receive, send)
+            return
+        state = scope["app"].state
+        database = getattr(state, "db", None)
+        db_token = current_app_db.set(database) if database is not None else None
+        services_token = current_app_services.set(state.services)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_app_services.reset(services_token)
+            if db_token is not None:
+                current_app_db.reset(db_token)
+
+
+class JwtKeyring:
+    """JWT signing keys by kid, from JWT_KEYRING_FILE or a single secret."""
+
+    def __init__(self, path: Optional[str] = None, secret: Optional[str] = None):
+        self.path = path
+        self.active = "default"
+        self.keys: Dict[str, str] = {"default": secret} if secret else {}
+        self._mtime = None
+        self._checked = 0.0
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path) as f:
+            data = json.load(f)
+        keys = data.get("keys") if isinstance(data, dict) else None
+        if not isinstance(keys, dict) or not keys or not all(isinstance(v, str) and v for v in keys.values()):
+            raise ValueError(f"{self.path}: 'keys' must map key ids to non-empty secrets")
+        if data.get("active") not in keys:
+            raise ValueError(f"{self.path}: 'active' must name one of the keys")
+        self.keys, self.active, self._mtime = keys, data["active"], mtime
+
+    def refresh(self) -> None:
+        if not self.path or time.monotonic() - self._checked < JWT_KEYRING_RELOAD_SECONDS:
+            return
+        self._checked = time.monotonic()
+        try:
+            if os.stat(self.path).st_mtime != self._mtime:
+                self._load()
+                logger.info("Reloaded JWT keyring, active key %s", self.active)
+        except (OSError, ValueError) as e:
+            # Keep serving with the keys we have; a half-written file must not lock everyone out
+            logger.error("Could not reload JWT keyring: %s", e)
+
+    def signing_key(self) -> Tuple[str, str]:
+        self.refresh()
+        return self.active, self.keys[self.active]
+
+    def verification_keys(self, kid: Optional[str]) -> List[str]:
+        self.refresh()
+        if kid is not None:
+            key = self.keys.get(kid)
+            return [key] if key else []
+        # Tokens issued before kid headers: try every key
+        return list(self.keys.values())
+
+
+# Without JWT_SECRET or a keyring, a random per-process secret (development only,
+# see JWT_ALLOW_RANDOM_SECRET; Settings.check refuses to start with it otherwise)
+jwt_keys = JwtKeyring(JWT_KEYRING_FILE, os.environ.get('JWT_SECRET') or str(uuid.uuid4()))
 
 # ----------------------------------------------------------------------------
-# App and Router
+# Routers (the app itself is built by create_app at the bottom)
 # ----------------------------------------------------------------------------
-app = FastAPI()
 api = APIRouter(prefix="/api")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Probes and metrics, served outside /api
+ops = APIRouter(include_in_schema=False)
 
 # ----------------------------------------------------------------------------
 # Security helpers
 # ----------------------------------------------------------------------------
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 
 def get_password_hash(password: str) -> str:
@@ -65,6 +593,119 @@ def verify_password(plain: str, hashed: str) -> bool:
         return False
 
 
+class PasswordHashPool:
+    """Bounded thread pool for bcrypt work.
+
+    bcrypt releases the GIL, so a few threads keep the event loop free while
+    hashes are computed. Counters are only touched from the loop thread.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        if self.max_pending and self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, try again")
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": min(self.pending, self.workers),
+            "queued": max(0, self.pending - self.workers),
+            "maxPendingSeen": self.max_pending_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    async def warm_up(self) -> None:
+        """Start every worker thread and load bcrypt before the first login."""
+        await asyncio.gather(*(self.run(get_password_hash, "warm-up") for _ in range(self.workers)))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # Fresh (lazily started) threads in case the app's lifespan runs again
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+
+hash_pool: PasswordHashPool = AppScoped("hash_pool")
+
+
+async def hash_password_async(password: str) -> str:
+    return await hash_pool.run(get_password_hash, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await hash_pool.run(verify_password, plain, hashed)
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire ttl seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Any, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Any) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRatio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+user_cache: TTLCache = AppScoped("user_cache")
+
+
+def invalidate_user(user_id: str) -> None:
+    user_cache.invalidate(user_id)
+
+
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
@@ -73,33 +714,95 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET, algorithm=JWT_ALGO)
+    kid, key = jwt_keys.signing_key()
+    encoded_jwt = jwt.encode(to_encode, key, algorithm=JWT_ALGO, headers={"kid": kid})
     return encoded_jwt
 
 
-async def decode_token(token: str) -> Dict[str, Any]:
+async def decode_token(token: str, scope: Optional[str] = None) -> Dict[str, Any]:
+    """Verified claims of token; scoped tokens are only accepted for their scope."""
     try:
-        payload = jwt.decode(token, SECRET, algorithms=[JWT_ALGO])
-        return payload
+        kid = jwt.get_unverified_header(token).get("kid")
+        for key in jwt_keys.verification_keys(kid):
+            try:
+                payload = jwt.decode(token, key, algorithms=[JWT_ALGO])
+            except jwt.InvalidSignatureError:
+                continue
+            if payload.get("scope") != scope:
+                break
+            return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
     except jwt.InvalidTokenError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        pass
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
-    payload = await decode_token(token)
+    return await user_from_payload(await decode_token(token))
+
+
+async def user_from_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     user_id = payload.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-    user = await db.users.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    user = user_cache.get(user_id) if USER_CACHE_ENABLED else None
+    if user is None:
+        user = await db.users.find_one({"id": user_id})
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        if USER_CACHE_ENABLED:
+            user_cache.set(user_id, user)
+    # Callers get their own copy so the cached document stays pristine
+    return dict(user)
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
+    """The caller's id, role and patientId, read from the token when trusted.
+
+    With TRUST_JWT_CLAIMS off, or for tokens issued without a role claim (or
+    patient tokens without a patientId claim), this falls back to the full
+    user document.
+    """
+    if not TRUST_JWT_CLAIMS:
+        return await get_current_user(token)
+    payload = await decode_token(token)
+    role = payload.get("role")
+    if not payload.get("sub") or not role or (role == "patient" and not payload.get("patientId")):
+        return await user_from_payload(payload)
+    principal = {"id": payload["sub"], "role": role}
+    if payload.get("patientId"):
+        principal["patientId"] = payload["patientId"]
+    return principal
+
+
+async def get_stream_principal(
+    patient_id: str,
+    access_token: Optional[str] = Query(None),
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+) -> Dict[str, Any]:
+    """Principal for a patient's event stream.
+
+    Browsers' EventSource cannot send headers, so besides the usual bearer
+    header this takes ?access_token=, but only a stream token from
+    POST /patients/{id}/events/token: short-lived and good for this
+    patient's stream alone, never the login token.
+    """
+    if token:
+        return await get_current_principal(token)
+    if not access_token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    payload = await decode_token(access_token, scope="events")
+    if payload.get("stream") != patient_id or not payload.get("sub") or not payload.get("role"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    principal = {"id": payload["sub"], "role": payload["role"]}
+    if payload.get("patientId"):
+        principal["patientId"] = payload["patientId"]
+    return principal
 
 
 def require_role(*roles: str):
-    async def _role_dep(user: Dict[str, Any] = Depends(get_current_user)):
+    async def _role_dep(user: Dict[str, Any] = Depends(get_current_principal)):
         if user.get("role") not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient role")
         return user
@@ -112,6 +815,9 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
+class StreamTokenResponse(TokenResponse):
+    expires_in: int
+
 class UserOut(BaseModel):
     id: str
     role: Literal['nutritionist','patient']
@@ -141,6 +847,10 @@ class MealItem(BaseModel):
     description: str
     amount: Optional[str] = None
     substitutions: Optional[List[str]] = None
+    # Entry in the food-composition table (GET /api/foods) and its weight;
+    # without grams, an amount like "120 g" is used for the totals
+    foodId: Optional[str] = None
+    grams: Optional[float] = Field(None, ge=0)
 
 class Meal(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -156,11 +866,50 @@ class PrescriptionCreate(BaseModel):
     meals: List[Meal] = []
     generalNotes: Optional[str] = None
 
+class FoodNutrients(BaseModel):
+    energyKcal: Optional[float] = None
+    proteinG: Optional[float] = None
+    carbohydrateG: Optional[float] = None
+    lipidG: Optional[float] = None
+    fiberG: Optional[float] = None
+
+class MealTotals(FoodNutrients):
+    mealId: Optional[str] = None
+
+class PlanTotals(BaseModel):
+    meals: List[MealTotals]
+    plan: FoodNutrients
+    # Items left out of the totals: no foodId, unknown food or no weight
+    unresolvedItems: int = 0
+
 class PrescriptionOut(PrescriptionCreate):
     id: str
     publishedAt: Optional[str] = None
     createdAt: str
     updatedAt: str
+    totals: Optional[PlanTotals] = None
+
+    @staticmethod
+    def fill_derived(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Totals for every plan of a response, computed in one batch."""
+        missing = [d for d in docs if d.get("totals") is None]
+        if not missing:
+            return docs
+        totals = iter(plans_totals(missing))
+        return [{**d, "totals": next(totals)} if d.get("totals") is None else d for d in docs]
+
+class PrescriptionSummaryOut(BaseModel):
+    id: str
+    patientId: str
+    nutritionistId: Optional[str] = None
+    title: str
+    status: Literal['draft','published']
+    publishedAt: Optional[str] = None
+    createdAt: str
+    updatedAt: str
+
+# Only the summary fields; meals and notes never leave the server
+PRESCRIPTION_SUMMARY_PROJECTION = {"_id": 0, **{f: 1 for f in PrescriptionSummaryOut.model_fields}}
 
 class InviteCreate(BaseModel):
     email: EmailStr
@@ -175,10 +924,96 @@ class InviteOut(BaseModel):
     createdAt: Optional[str] = None
     expiresAt: Optional[str] = None
 
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class BulkImportResult(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    errors: List[ImportRowError] = []
+    errorsTruncated: bool = False
+
+class PrescriptionFanOut(BaseModel):
+    patientIds: List[str] = Field(min_length=1, max_length=FANOUT_MAX_PATIENTS)
+    publish: bool = False
+    title: Optional[str] = None
+
+class FanOutRow(BaseModel):
+    patientId: str
+    prescriptionId: Optional[str] = None
+    error: Optional[str] = None
+
+class FanOutResult(BaseModel):
+    created: int
+    failed: int
+    results: List[FanOutRow]
+
+class SearchHit(BaseModel):
+    type: Literal['patient', 'prescription']
+    id: str
+    score: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+    patientId: Optional[str] = None
+    title: Optional[str] = None
+    status: Optional[str] = None
+
+class EnergyFormulas(BaseModel):
+    mifflinStJeor: Optional[float] = None
+    harrisBenedict: Optional[float] = None
+
+class EnergyEstimateOut(BaseModel):
+    patientId: str
+    name: Optional[str] = None
+    ageYears: Optional[int] = None
+    sex: Optional[Literal['male','female']] = None
+    bmr: EnergyFormulas
+    tee: EnergyFormulas
+    # Fields that were absent or unusable, leaving the estimates empty
+    missing: List[str] = []
+
+class TotalsBatch(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=TOTALS_BATCH_MAX)
+
+class TotalsBatchResult(BaseModel):
+    totals: Dict[str, PlanTotals]
+    # Requested ids that do not exist or are not visible to the caller
+    missing: List[str] = []
+
+class FoodOut(BaseModel):
+    id: str
+    name: str
+    group: Optional[str] = None
+    per100g: FoodNutrients
+
+class PrescriptionCounts(BaseModel):
+    draft: int = 0
+    published: int = 0
+
+class InviteCounts(BaseModel):
+    active: int = 0
+    used: int = 0
+    revoked: int = 0
+    expired: int = 0
+
+class DashboardOut(BaseModel):
+    patients: int = 0
+    prescriptions: PrescriptionCounts = Field(default_factory=PrescriptionCounts)
+    invites: InviteCounts = Field(default_factory=InviteCounts)
+    source: Literal['counters', 'live']
+
 class InviteRevokeResponse(BaseModel):
     id: str
     status: Literal['revoked','used','expired','active']
 
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    nextCursor: Optional[str] = None
+
 # ----------------------------------------------------------------------------
 # Utilities
 # ----------------------------------------------------------------------------
@@ -190,6 +1025,206 @@ def to_doc_id(doc: Dict[str, Any]) -> Dict[str, Any]:
     d.pop('_id', None)
     return d
 
+async def raise_missing_or_forbidden(coll, doc_id: str, not_found: str = "Not found"):
+    """Failure path of an ACL-filtered write: tell 404 from 403 with one extra lookup."""
+    if await coll.find_one({"id": doc_id}, {"_id": 1}):
+        raise HTTPException(403, "Forbidden")
+    raise HTTPException(404, not_found)
+
+def _model_defaults(model) -> Dict[str, Any]:
+    return {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+
+def _nested_model(annotation) -> Tuple[Optional[type], bool]:
+    """(model, is_list) for a field holding a model, a list of them or an Optional of either."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin is list and args:
+        inner, _ = _nested_model(args[0])
+        return inner, inner is not None
+    if origin is Union:
+        for arg in args:
+            if arg is not type(None):
+                found = _nested_model(arg)
+                if found[0] is not None:
+                    return found
+    return None, False
+
+@functools.lru_cache(maxsize=None)
+def _shape_of(model) -> Tuple[Dict[str, Any], Tuple[str, ...], Dict[str, Tuple[type, bool]]]:
+    """Defaults, field names and nested model fields of model, worked out once."""
+    nested = {name: _nested_model(field.annotation) for name, field in model.model_fields.items()}
+    return (
+        _model_defaults(model),
+        tuple(model.model_fields),
+        {name: found for name, found in nested.items() if found[0] is not None},
+    )
+
+def shape_doc(model, doc: Dict[str, Any]) -> Dict[str, Any]:
+    defaults, fields, nested = _shape_of(model)
+    # In field order, so the JSON matches what the model would produce
+    out = {k: doc[k] if k in doc else defaults[k] for k in fields if k in doc or k in defaults}
+    for name, (sub, is_list) in nested.items():
+        value = out.get(name)
+        if value is not None:
+            out[name] = [shape_doc(sub, v) for v in value] if is_list else shape_doc(sub, value)
+    return out
+
+def with_derived(model, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """docs with the fields the model derives (fill_derived) added, once per response."""
+    fill = getattr(model, "fill_derived", None)
+    return fill(docs) if fill else docs
+
+def trusted_docs(model, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Shape stored documents like model without validating them.
+
+    Only the model's fields are kept, with missing ones set to their defaults,
+    at every level (meals and their items too; writes store them without
+    their None fields). Values are not coerced, which is safe because every
+    write path validated them.
+    """
+    return [shape_doc(model, d) for d in with_derived(model, docs)]
+
+def json_bytes(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":")).encode()
+
+def fast_json(content: Any) -> Response:
+    return Response(content=json_bytes(content), media_type="application/json")
+
+def respond_one(model, doc: Optional[Dict[str, Any]]):
+    if FAST_RESPONSES:
+        return fast_json(trusted_docs(model, [doc])[0] if doc is not None else None)
+    return model(**to_doc_id(with_derived(model, [doc])[0])) if doc is not None else None
+
+def respond_list(model, docs: List[Dict[str, Any]]):
+    if FAST_RESPONSES:
+        return fast_json(trusted_docs(model, docs))
+    return [model(**to_doc_id(d)) for d in with_derived(model, docs)]
+
+def respond_page(model, docs: List[Dict[str, Any]], next_cursor: Optional[str]):
+    if FAST_RESPONSES:
+        return fast_json({"items": trusted_docs(model, docs), "nextCursor": next_cursor})
+    return Page[model](items=[model(**to_doc_id(d)) for d in with_derived(model, docs)], nextCursor=next_cursor)
+
+# Just enough of a document to compute its ETag (and a page cursor)
+ETAG_PROJECTION = {"_id": 0, "id": 1, "createdAt": 1, "updatedAt": 1}
+# Whole documents minus what only the server reads
+DOC_PROJECTION = {"_id": 0, "searchKeys": 0, "notesKeys": 0}
+
+def etag_for(docs: List[Dict[str, Any]], variant: str = "") -> str:
+    """Strong ETag over the id+updatedAt of each document, in order.
+
+    For a single resource this changes exactly when it is written; for a
+    listing it also changes when rows are added. variant separates
+    representations of the same rows (full vs summary, page parameters).
+    """
+    h = hashlib.sha1(variant.encode())
+    for d in docs:
+        h.update(f"\n{d['id']}:{d.get('updatedAt')}".encode())
+    return f'"{h.hexdigest()}"'
+
+def plan_variant(variant: str = "") -> str:
+    """ETag variant for representations with nutrient totals, which also
+    change when the food table does."""
+    return f"{variant}|foods:{food_index().version}"
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return "*" in candidates or tag in candidates
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag})
+
+def with_etag(result: Any, response: Response, tag: str) -> Any:
+    # Raw responses from the fast path bypass the injected response's headers
+    target = result if isinstance(result, Response) else response
+    target.headers["ETag"] = tag
+    return result
+
+def prescription_acl(user: Dict[str, Any], patient_id: Optional[str] = None) -> Dict[str, Any]:
+    """Filter restricting prescriptions to the ones the caller may read.
+
+    Ownership is denormalized onto each prescription (ownerId), so reads need
+    no patient lookup. A patient asking for another patient's data is refused
+    up front.
+    """
+    if user["role"] == "patient":
+        if patient_id is not None and user.get("patientId") != patient_id:
+            raise HTTPException(403, "Forbidden")
+        return {"patientId": user.get("patientId")}
+    return {"ownerId": user["id"]}
+
+async def check_patient_access(user: Dict[str, Any], patient_id: str) -> None:
+    """Raise 404/403 for a patient the caller cannot see.
+
+    Prescription reads only call this when their ACL-filtered query came back
+    empty, to tell "no plans yet" apart from "not your patient".
+    """
+    pt = await db.patients.find_one({"id": patient_id}, {"_id": 0, "ownerId": 1})
+    if not pt:
+        raise HTTPException(404, "Patient not found")
+    if user["role"] == "nutritionist" and pt["ownerId"] != user["id"]:
+        raise HTTPException(403, "Forbidden")
+
+def invite_status(inv: Dict[str, Any], now: datetime) -> str:
+    """Effective status of an invite, treating past-due active ones as expired."""
+    status_val = inv.get("status", "active")
+    if status_val == "active" and inv.get("expiresAt"):
+        try:
+            if datetime.fromisoformat(inv["expiresAt"]) < now:
+                return "expired"
+        except ValueError:
+            pass
+    return status_val
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    raw = json.dumps([doc.get("createdAt"), doc["id"]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[str], str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, doc_id = json.loads(raw)
+        if not isinstance(created_at, (str, type(None))) or not isinstance(doc_id, str):
+            raise ValueError(cursor)
+        return created_at, doc_id
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
+async def fetch_page(
+    coll,
+    flt: Dict[str, Any],
+    limit: Optional[int],
+    cursor: Optional[str],
+    projection: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Keyset page over (createdAt, id) descending, newest first.
+
+    The cursor encodes the last row of the previous page, so each page is a
+    bounded index range scan no matter how deep the client has paged. Rows
+    without a createdAt sort after every dated row, as Mongo orders null
+    below strings.
+    """
+    limit = limit or DEFAULT_PAGE_SIZE
+    query = dict(flt)
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor)
+        query["$or"] = [{"createdAt": created_at, "id": {"$lt": doc_id}}]
+        if created_at is not None:
+            # $lt compares strings only, so the undated rows need their own branch
+            query["$or"] += [{"createdAt": {"$lt": created_at}}, {"createdAt": None}]
+    rows = await coll.find(query, projection).sort([("createdAt", DESCENDING), ("id", DESCENDING)]).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
 async def seed_default_nutritionist():
     existing = await db.users.find_one({"email": "pro@dinutri.app"})
     if existing:
@@ -199,12 +1234,1022 @@ async def seed_default_nutritionist():
         "role": "nutritionist",
         "name": "Pro Nutritionist",
         "email": "pro@dinutri.app",
-        "passwordHash": get_password_hash("password123"),
+        "passwordHash": await hash_password_async("password123"),
         "createdAt": now_iso(),
         "updatedAt": now_iso(),
     }
     await db.users.insert_one(user)
 
+# ----------------------------------------------------------------------------
+# Indexes
+# ----------------------------------------------------------------------------
+# Every index the routes rely on. Names are derived from the key spec so a
+# changed definition shows up as a new index plus an unmanaged leftover.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "patients": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("ownerId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("ownerId", ASCENDING), ("searchKeys", ASCENDING)]),
+    ],
+    "prescriptions": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("patientId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("patientId", ASCENDING), ("status", ASCENDING), ("publishedAt", DESCENDING)]),
+        IndexModel([("ownerId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("ownerId", ASCENDING), ("searchKeys", ASCENDING)]),
+    ],
+    "invites": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("token", ASCENDING)], unique=True),
+        IndexModel([("nutritionistId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("expiresAt", ASCENDING)]),
+        IndexModel([("nutritionistId", ASCENDING), ("status", ASCENDING), ("expiresAt", ASCENDING)]),
+    ],
+}
+
+# The hot query of each route as (collection, filter, sort). Values are
+# placeholders; only the shape matters to the planner.
+HOT_QUERIES: Dict[str, Any] = {
+    "login": ("users", {"email": "x"}, None),
+    "get_current_user": ("users", {"id": "x"}, None),
+    "list_patients": ("patients", {"ownerId": "x"}, [("createdAt", DESCENDING), ("id", DESCENDING)]),
+    "get_patient": ("patients", {"id": "x"}, None),
+    "list_prescriptions": ("prescriptions", {"patientId": "x", "ownerId": "x"}, [("createdAt", DESCENDING), ("id", DESCENDING)]),
+    "get_prescription": ("prescriptions", {"id": "x", "ownerId": "x"}, None),
+    "latest_published": ("prescriptions", {"patientId": "x", "ownerId": "x", "status": "published"}, [("publishedAt", DESCENDING)]),
+    "list_invites": ("invites", {"nutritionistId": "x"}, [("createdAt", DESCENDING), ("id", DESCENDING)]),
+    "get_invite": ("invites", {"token": "x"}, None),
+    "invite_sweeper": ("invites", {"status": "active", "expiresAt": {"$lt": "x"}}, None),
+    "invite_sweeper_owner": ("invites", {"nutritionistId": "x", "status": "active", "expiresAt": {"$lt": "x"}}, None),
+    "export_prescriptions": ("prescriptions", {"ownerId": "x"}, [("createdAt", DESCENDING), ("id", DESCENDING)]),
+    "search_patients": ("patients", {"ownerId": "x", "searchKeys": {"$all": ["x"]}}, None),
+    "search_prescriptions": ("prescriptions", {"ownerId": "x", "searchKeys": {"$all": ["x"]}}, None),
+}
+
+
+def _index_signature(key, unique: bool) -> tuple:
+    return (tuple((k, int(v) if isinstance(v, (int, float)) else v) for k, v in key), bool(unique))
+
+
+async def ensure_indexes() -> Dict[str, Dict[str, List[str]]]:
+    """Create the registered indexes and report drift against the live database.
+
+    create_indexes is idempotent, so this is safe to run on every startup. The
+    report lists, per collection, indexes that were missing, that exist with
+    different options, and that exist but are not in the registry.
+    """
+    report: Dict[str, Dict[str, List[str]]] = {}
+    for coll_name, models in INDEXES.items():
+        coll = db[coll_name]
+        existing = await coll.index_information()
+        live = {
+            name: _index_signature(info["key"], info.get("unique", False))
+            for name, info in existing.items() if name != "_id_"
+        }
+        missing: List[str] = []
+        conflicts: List[str] = []
+        for model in models:
+            spec = model.document
+            name = spec["name"]
+            wanted = _index_signature(spec["key"].items(), spec.get("unique", False))
+            if name not in live:
+                missing.append(name)
+            elif live[name] != wanted:
+                conflicts.append(name)
+        registered = {m.document["name"] for m in models}
+        unmanaged = sorted(set(live) - registered)
+
+        to_create = [m for m in models if m.document["name"] in missing]
+        if to_create:
+            try:
+                await coll.create_indexes(to_create)
+                for name in missing:
+                    logger.info("Created index %s.%s", coll_name, name)
+            except OperationFailure as e:
+                logger.error("Could not create indexes on %s: %s", coll_name, e)
+
+        for name in conflicts:
+            logger.warning("Index %s.%s differs from the registry; drop it to let startup recreate it", coll_name, name)
+        for name in unmanaged:
+            logger.warning("Index %s.%s is not in the registry", coll_name, name)
+        report[coll_name] = {"missing": missing, "conflicts": conflicts, "unmanaged": unmanaged}
+    return report
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            stages += _plan_stages(plan[key])
+    for sub in plan.get("inputStages", []):
+        stages += _plan_stages(sub)
+    return stages
+
+
+async def verify_query_plans() -> Dict[str, List[str]]:
+    """Explain each hot query and return the ones that are not served by an index.
+
+    A query fails when its winning plan has a COLLSCAN or has no IXSCAN at all.
+    The result maps route name to the stages of the offending plan.
+    """
+    failures: Dict[str, List[str]] = {}
+    for route, (coll_name, flt, sort) in HOT_QUERIES.items():
+        cursor = db[coll_name].find(flt).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        explained = await cursor.explain()
+        stages = _plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages or "IXSCAN" not in stages:
+            failures[route] = stages
+    return failures
+
+# ----------------------------------------------------------------------------
+# Migrations
+# ----------------------------------------------------------------------------
+async def backfill_prescription_owner():
+    """Copy each patient's ownerId onto prescriptions created before it was stored."""
+    await db.prescriptions.aggregate([
+        {"$match": {"ownerId": {"$exists": False}}},
+        {"$lookup": {"from": "patients", "localField": "patientId", "foreignField": "id", "as": "pt"}},
+        {"$project": {"ownerId": {"$first": "$pt.ownerId"}}},
+        {"$match": {"ownerId": {"$ne": None}}},
+        {"$merge": {"into": "prescriptions", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ]).to_list(length=None)
+
+async def backfill_invite_created_at():
+    """Give legacy invites a createdAt taken from their ObjectId timestamp."""
+    await db.invites.update_many(
+        {"$or": [{"createdAt": {"$exists": False}}, {"createdAt": None}]},
+        [{"$set": {"createdAt": {"$dateToString": {"date": {"$toDate": "$_id"}, "format": "%Y-%m-%dT%H:%M:%S.%L000+00:00"}}}}],
+    )
+
+async def backfill_dashboard_counters():
+    """Seed every nutritionist's dashboard counters; the writing routes keep them current."""
+    now = now_iso()
+    ops = [
+        UpdateOne({"_id": owner_id}, {"$set": {**counts, "updatedAt": now}}, upsert=True)
+        for owner_id, counts in (await count_dashboard()).items()
+    ]
+    if ops:
+        await db.dashboard_counters.bulk_write(ops, ordered=False)
+
+async def backfill_search_keys():
+    """Give patients and prescriptions written before search their searchKeys."""
+    for coll, search_doc, projection in (
+        (db.patients, patient_search_doc, PATIENT_SEARCH_PROJECTION),
+        (db.prescriptions, prescription_search_doc, PRESCRIPTION_SEARCH_PROJECTION),
+    ):
+        ops: List[UpdateOne] = []
+        async for doc in coll.find({"searchKeys": {"$exists": False}}, {**projection, "_id": 1}):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_doc(doc)}))
+            if len(ops) >= BULK_IMPORT_CHUNK_SIZE:
+                await coll.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            await coll.bulk_write(ops, ordered=False)
+
+# One-off data migrations, applied once each and recorded in db.migrations
+MIGRATIONS = [
+    ("prescription_owner_backfill", backfill_prescription_owner),
+    ("invite_created_at_backfill", backfill_invite_created_at),
+    ("dashboard_counters_backfill", backfill_dashboard_counters),
+    ("search_keys_backfill", backfill_search_keys),
+]
+
+async def run_migrations():
+    for name, fn in MIGRATIONS:
+        if await db.migrations.find_one({"_id": name}):
+            continue
+        logger.info("Applying migration %s", name)
+        await fn()
+        try:
+            await db.migrations.insert_one({"_id": name, "appliedAt": now_iso()})
+        except DuplicateKeyError:
+            pass  # another worker finished it first; migrations are idempotent
+
+# ----------------------------------------------------------------------------
+# Plan events (Server-Sent Events)
+# ----------------------------------------------------------------------------
+class PlanEventBroker:
+    """In-process pub/sub of plan changes, keyed by patient id.
+
+    Each connection is just a small bounded queue, so idle subscribers cost
+    almost nothing. Recent events are kept in a ring buffer so a client that
+    reconnects with Last-Event-ID gets what it missed; if it fell out of the
+    buffer (or the process restarted), it is told to resync instead.
+    """
+
+    def __init__(self, history_size: int, queue_size: int):
+        self._subscribers: Dict[str, set] = {}
+        self._history: deque = deque(maxlen=history_size)
+        self._queue_size = queue_size
+        # Millisecond seed keeps ids increasing across restarts
+        self._first_id = int(time.time() * 1000)
+        self._next_id = self._first_id
+
+    @property
+    def connections(self) -> int:
+        return sum(len(qs) for qs in self._subscribers.values())
+
+    def publish(self, patient_id: str, event: str, data: Dict[str, Any]) -> None:
+        self._next_id += 1
+        item = (self._next_id, patient_id, event, data)
+        self._history.append(item)
+        for queue in self._subscribers.get(patient_id, ()):
+            if queue.full():
+                queue.get_nowait()  # slow reader: drop its oldest event
+            queue.put_nowait(item)
+
+    def subscribe(self, patient_id: str, last_event_id: Optional[int]) -> Tuple[asyncio.Queue, List[tuple]]:
+        """Register a queue and return it with the events to replay first."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers.setdefault(patient_id, set()).add(queue)
+        if last_event_id is None:
+            return queue, []
+        oldest = self._history[0][0] if self._history else self._next_id + 1
+        if last_event_id < self._first_id or last_event_id < oldest - 1:
+            return queue, [(self._next_id, patient_id, "resync", {})]
+        return queue, [e for e in self._history if e[0] > last_event_id and e[1] == patient_id]
+
+    def unsubscribe(self, patient_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(patient_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[patient_id]
+
+
+plan_events: PlanEventBroker = AppScoped("plan_events")
+
+
+def notify_plan_change(p: Dict[str, Any], event: str, was: Optional[str] = None) -> None:
+    """Tell the patient's subscribers that their published plan changed.
+
+    was is the plan's status before the write; a published plan turned
+    back into a draft is sent as "unpublished" so clients drop it.
+    """
+    if p.get("status") != "published":
+        if was != "published":
+            return
+        event = "unpublished"
+    plan_events.publish(p["patientId"], event, {f: p.get(f) for f in PrescriptionSummaryOut.model_fields})
+
+
+def format_sse(event_id: int, event: str, data: Dict[str, Any]) -> bytes:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+# ----------------------------------------------------------------------------
+# Latest plan cache
+# ----------------------------------------------------------------------------
+class SingleFlightCache:
+    """TTLCache front with single-flight loading.
+
+    Concurrent misses for one key share a single load. invalidate() detaches
+    a running load, so callers arriving after a write start a fresh one
+    instead of joining a read that may predate it. Each key also carries a
+    generation that invalidate() bumps, so a detached load never stores its
+    stale result.
+    """
+
+    def __init__(self, loader, maxsize: int, ttl: float):
+        self._loader = loader
+        self._cache = TTLCache(maxsize, ttl)
+        self._inflight: Dict[Any, asyncio.Task] = {}
+        self._generations: Dict[Any, int] = {}
+        # Loads still running per key, detached ones included
+        self._running: Dict[Any, int] = {}
+        self.loads = 0
+        self.coalesced = 0
+
+    async def get(self, key: Any) -> Any:
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            # A task of its own, so one caller disconnecting cannot cancel the
+            # load the others are waiting on
+            task = asyncio.ensure_future(self._load(key, self._generations.get(key, 0)))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Any, generation: int) -> Any:
+        task = asyncio.current_task()
+        self._running[key] = self._running.get(key, 0) + 1
+        try:
+            self.loads += 1
+            value = await self._loader(key)
+            if value is not None and self._generations.get(key, 0) == generation:
+                self._cache.set(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+            self._running[key] -= 1
+            if not self._running[key]:
+                del self._running[key]
+                self._generations.pop(key, None)
+
+    def invalidate(self, key: Any) -> None:
+        self._cache.invalidate(key)
+        self._inflight.pop(key, None)
+        if key in self._running:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "loads": self.loads, "coalesced": self.coalesced, "inflight": len(self._inflight)}
+
+
+async def load_latest_plan(patient_id: str) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+    """(ownerId, latest published plan or None) for a patient; None if no such patient."""
+    p = await db.prescriptions.find(
+        {"patientId": patient_id, "status": "published"}, DOC_PROJECTION
+    ).sort("publishedAt", -1).limit(1).to_list(length=1)
+    if p:
+        return p[0]["ownerId"], p[0]
+    pt = await db.patients.find_one({"id": patient_id}, {"_id": 0, "ownerId": 1})
+    return (pt["ownerId"], None) if pt else None
+
+
+latest_plans: SingleFlightCache = AppScoped("latest_plans")
+
+# ----------------------------------------------------------------------------
+# Food composition
+# ----------------------------------------------------------------------------
+# CSV column -> FoodNutrients field, in nutrient-matrix column order
+FOOD_NUTRIENTS = (
+    ("energy_kcal", "energyKcal"),
+    ("protein_g", "proteinG"),
+    ("carbohydrate_g", "carbohydrateG"),
+    ("lipid_g", "lipidG"),
+    ("fiber_g", "fiberG"),
+)
+# Longest word prefix kept in the index; longer query words are checked per row
+FOOD_PREFIX_MAX = 8
+
+
+def fold(text: str) -> str:
+    """Lowercase without accents, so "acai" finds "Açaí"."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def fold_words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", fold(text))
+
+
+def parse_nutrient(value: Optional[str]) -> float:
+    # TACO marks traces as "Tr" and missing analyses as "NA", "*" or blank
+    value = (value or "").strip()
+    if value.lower() in ("tr", "traco"):
+        return 0.0
+    try:
+        return float(value.replace(",", "."))
+    except ValueError:
+        return float("nan")
+
+
+class FoodIndex:
+    """Food-composition rows held in memory for autocomplete and nutrient math.
+
+    Nutrients live in one float matrix (row per food, column per
+    FOOD_NUTRIENTS entry, per 100 g). Autocomplete uses an edge n-gram
+    index: every prefix of every folded word maps to the rows containing
+    it, pre-sorted by rank (earliest word position, then shortest name), so
+    a lookup reads the first few postings and never sorts at query time.
+    """
+
+    def __init__(self, rows: List[Dict[str, str]]):
+        self.ids = [r["id"] for r in rows]
+        self.row_of = {food_id: i for i, food_id in enumerate(self.ids)}
+        self.nutrients = np.array(
+            [[parse_nutrient(r.get(col)) for col, _ in FOOD_NUTRIENTS] for r in rows],
+            dtype=np.float64,
+        ).reshape(len(rows), len(FOOD_NUTRIENTS))
+        # Totals treat a nutrient that was not analysed as zero
+        self.filled = np.nan_to_num(self.nutrients)
+        # Changes whenever totals computed from this table could; part of plan ETags
+        h = hashlib.sha1("\n".join(self.ids).encode())
+        h.update(self.nutrients.tobytes())
+        self.version = h.hexdigest()[:16]
+        # Response bodies are built once; NaN (not analysed) becomes null
+        self.out = [
+            {
+                "id": r["id"],
+                "name": r["name"],
+                "group": r.get("group") or None,
+                "per100g": {
+                    field: (None if np.isnan(v) else float(v))
+                    for (_, field), v in zip(FOOD_NUTRIENTS, self.nutrients[i])
+                },
+            }
+            for i, r in enumerate(rows)
+        ]
+        self.words = [fold_words(r["name"]) for r in rows]
+        best: Dict[str, Dict[int, int]] = {}
+        for row, words in enumerate(self.words):
+            for pos, word in enumerate(words):
+                for n in range(1, min(len(word), FOOD_PREFIX_MAX) + 1):
+                    seen = best.setdefault(word[:n], {})
+                    if pos < seen.get(row, len(words)):
+                        seen[row] = pos
+        # prefix -> (rows in rank order, same rows sorted by id, rank of each sorted row)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for prefix, rows_at in best.items():
+            ranked = np.array(
+                sorted(rows_at, key=lambda row: (rows_at[row], len(self.out[row]["name"]), self.out[row]["name"])),
+                dtype=np.int32,
+            )
+            by_row = np.argsort(ranked, kind="stable").astype(np.int32)
+            self.postings[prefix] = (ranked, ranked[by_row], by_row)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "FoodIndex":
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [r for r in csv.DictReader(f) if r.get("id") and r.get("name")]
+        return cls(rows)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get(self, food_id: str) -> Optional[Dict[str, Any]]:
+        row = self.row_of.get(food_id)
+        return self.out[row] if row is not None else None
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Foods having a word starting with each query word, ranked by the first."""
+        terms = fold_words(query)
+        lists = [self.postings.get(t[:FOOD_PREFIX_MAX]) for t in terms]
+        if not terms or any(p is None for p in lists):
+            return []
+        long_terms = [t for t in terms if len(t) > FOOD_PREFIX_MAX]
+        ranked, rows, ranks = lists[0]
+        if len(lists) == 1:
+            candidates = ranked
+        else:
+            for _, other_rows, _ in lists[1:]:
+                _, keep, _ = np.intersect1d(rows, other_rows, assume_unique=True, return_indices=True)
+                rows, ranks = rows[keep], ranks[keep]
+            candidates = rows[np.argsort(ranks)]
+        if not long_terms:
+            candidates = candidates[:limit]
+        hits = []
+        for row in candidates.tolist():
+            if long_terms and not all(any(w.startswith(t) for w in self.words[row]) for t in long_terms):
+                continue
+            hits.append(self.out[row])
+            if len(hits) >= limit:
+                break
+        return hits
+
+
+_food_index: Optional[FoodIndex] = None
+
+
+def food_index() -> FoodIndex:
+    """The food table, loaded on first use (and during warm-up)."""
+    global _food_index
+    if _food_index is None:
+        _food_index = FoodIndex.from_csv(FOODS_CSV)
+    return _food_index
+
+
+def check_food_ids(payload: "PrescriptionCreate") -> None:
+    foods = food_index()
+    for meal in payload.meals:
+        for item in meal.items:
+            if item.foodId is not None and foods.get(item.foodId) is None:
+                raise HTTPException(400, f"Unknown foodId: {item.foodId}")
+
+# ----------------------------------------------------------------------------
+# Nutrient totals
+# ----------------------------------------------------------------------------
+AMOUNT_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*(kg|g|gr|gramas?)\s*$", re.IGNORECASE)
+# Only what the totals read, for fetching many plans at once
+TOTALS_PROJECTION = {"_id": 0, "id": 1, "updatedAt": 1, "meals.id": 1, "meals.items.foodId": 1,
+                     "meals.items.grams": 1, "meals.items.amount": 1}
+
+
+def item_grams(item: Dict[str, Any]) -> Optional[float]:
+    if item.get("grams") is not None:
+        return float(item["grams"])
+    m = AMOUNT_RE.match(item.get("amount") or "")
+    if not m:
+        return None
+    value = float(m.group(1).replace(",", "."))
+    return value * 1000 if m.group(2).lower() == "kg" else value
+
+
+def compute_totals(plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Per-meal and per-plan nutrient totals for many plans in one pass.
+
+    Every resolvable item of every plan becomes one row: its food's
+    per-100 g nutrient vector scaled by grams / 100. Rows are summed into
+    meals with bincount and meals into plans the same way.
+    """
+    foods = food_index()
+    rows: List[int] = []
+    grams: List[float] = []
+    item_meal: List[int] = []
+    meal_plan: List[int] = []
+    meal_ids: List[Optional[str]] = []
+    unresolved = [0] * len(plans)
+    for plan_no, p in enumerate(plans):
+        for meal in p.get("meals") or []:
+            meal_no = len(meal_ids)
+            meal_ids.append(meal.get("id"))
+            meal_plan.append(plan_no)
+            for item in meal.get("items") or []:
+                row = foods.row_of.get(item.get("foodId"))
+                weight = item_grams(item)
+                if row is None or weight is None:
+                    unresolved[plan_no] += 1
+                    continue
+                rows.append(row)
+                grams.append(weight)
+                item_meal.append(meal_no)
+    contrib = foods.filled[np.array(rows, dtype=np.intp)] * (np.array(grams) / 100.0)[:, None]
+    # bincount of nothing is int64; keep every total a float for the JSON
+    meal_totals = np.column_stack([
+        np.bincount(item_meal, weights=contrib[:, j], minlength=len(meal_ids)) for j in range(len(FOOD_NUTRIENTS))
+    ]).astype(np.float64).reshape(len(meal_ids), len(FOOD_NUTRIENTS)).round(1)
+    per_plan = np.column_stack([
+        np.bincount(meal_plan, weights=meal_totals[:, j], minlength=len(plans)) for j in range(len(FOOD_NUTRIENTS))
+    ]).astype(np.float64).reshape(len(plans), len(FOOD_NUTRIENTS)).round(1)
+    fields = [field for _, field in FOOD_NUTRIENTS]
+    out = [{"meals": [], "plan": dict(zip(fields, per_plan[i].tolist())), "unresolvedItems": unresolved[i]}
+           for i in range(len(plans))]
+    for meal_no, (plan_no, meal_id) in enumerate(zip(meal_plan, meal_ids)):
+        out[plan_no]["meals"].append({"mealId": meal_id, **dict(zip(fields, meal_totals[meal_no].tolist()))})
+    return out
+
+
+# (food table version, id, updatedAt) -> totals; a plan edit changes
+# updatedAt and a new food table its version, so entries never go stale
+nutrient_cache: TTLCache = AppScoped("nutrient_cache")
+
+
+def plans_totals(plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Totals for each plan, computing all cache misses in one batch."""
+    version = food_index().version
+    keys = [(version, p.get("id"), p.get("updatedAt")) for p in plans]
+    found = [nutrient_cache.get(k) for k in keys]
+    misses = [i for i, t in enumerate(found) if t is None]
+    if misses:
+        for i, totals in zip(misses, compute_totals([plans[i] for i in misses])):
+            found[i] = totals
+            if keys[i][1] and keys[i][2]:
+                nutrient_cache.set(keys[i], totals)
+    return found
+
+
+# ----------------------------------------------------------------------------
+# Energy estimates
+# ----------------------------------------------------------------------------
+# Physical activity level multipliers applied to BMR for TEE
+ACTIVITY_FACTORS = {"sedentary": 1.2, "light": 1.375, "moderate": 1.55, "active": 1.725, "very_active": 1.9}
+ENERGY_PROJECTION = {"_id": 0, "id": 1, "name": 1, "birthDate": 1, "sex": 1, "heightCm": 1, "weightKg": 1}
+ENERGY_INPUTS = ("weightKg", "heightCm", "birthDate", "sex")
+MISSING_FIELDS = [tuple(f for bit, f in enumerate(ENERGY_INPUTS) if code >> bit & 1) for code in range(16)]
+
+
+def float_column(values: List[Any]) -> np.ndarray:
+    """Floats with NaN for missing or unparsable values."""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        out = np.full(len(values), np.nan)
+        for i, v in enumerate(values):
+            try:
+                out[i] = float(v)
+            except (TypeError, ValueError):
+                pass
+        return out
+
+
+def date_column(values: List[Any]) -> np.ndarray:
+    """ISO dates (or DD/MM/YYYY) as datetime64[D], NaT where unusable."""
+    raw = np.array([v[:10] if isinstance(v, str) and v else "NaT" for v in values], dtype=str)
+    try:
+        return raw.astype("datetime64[D]")
+    except ValueError:
+        out = np.full(len(raw), np.datetime64("NaT"), dtype="datetime64[D]")
+        for i, v in enumerate(raw.tolist()):
+            for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+                try:
+                    out[i] = np.datetime64(datetime.strptime(v, fmt).date(), "D")
+                    break
+                except ValueError:
+                    pass
+        return out
+
+
+def calendar_years(birth: np.ndarray, today: np.datetime64) -> np.ndarray:
+    """Completed years of age, NaN where the birth date is NaT."""
+    def month_day(d):
+        months = d.astype("datetime64[M]")
+        return (months - d.astype("datetime64[Y]")).astype(np.int64) * 32 + (d - months).astype(np.int64)
+
+    years = (today.astype("datetime64[Y]") - birth.astype("datetime64[Y]")).astype(np.int64)
+    age = (years - (month_day(np.array([today]))[0] < month_day(birth))).astype(np.float64)
+    age[np.isnat(birth)] = np.nan
+    return age
+
+
+def nullable(values: np.ndarray, digits: int = 0) -> List[Optional[float]]:
+    return np.where(np.isnan(values), None, values.round(digits)).tolist()
+
+
+def energy_estimates(docs: List[Dict[str, Any]], activity_factor: float, today: Optional[str] = None) -> List[Dict[str, Any]]:
+    """BMR and TEE (kcal/day) per patient, every formula evaluated on whole columns.
+
+    Mifflin-St Jeor (1990) and Harris-Benedict as revised by Roza and
+    Shizgal (1984); ages are completed years. A patient missing weight, height,
+    birth date or a recognisable sex gets empty estimates and the gap is
+    listed in "missing".
+    """
+    today_d = np.datetime64(today or datetime.now(timezone.utc).date().isoformat(), "D")
+    weight = float_column([d.get("weightKg") for d in docs])
+    height = float_column([d.get("heightCm") for d in docs])
+    birth = date_column([d.get("birthDate") for d in docs])
+    age = calendar_years(birth, today_d)
+    # only the initial matters (M/F, masculino/feminino, male/female)
+    sex = np.char.lower(np.array([v[:1] if isinstance(v, str) else "" for v in (d.get("sex") for d in docs)], dtype="<U1"))
+    male, female = sex == "m", sex == "f"
+
+    bad_weight = ~(weight > 0)
+    bad_height = ~(height > 0)
+    bad_age = ~((age >= 0) & (age < 130))
+    bad_sex = ~(male | female)
+    # NaN propagates, so any unusable input empties that patient's estimates
+    unusable = bad_weight | bad_height | bad_age | bad_sex
+    weight[unusable] = np.nan
+
+    mifflin = 10.0 * weight + 6.25 * height - 5.0 * age + np.where(male, 5.0, -161.0)
+    harris = np.where(
+        male,
+        88.362 + 13.397 * weight + 4.799 * height - 5.677 * age,
+        447.593 + 9.247 * weight + 3.098 * height - 4.330 * age,
+    )
+    # one bit per missing input, decoded through a 16-entry table
+    gaps = bad_weight * 1 | bad_height * 2 | bad_age * 4 | bad_sex * 8
+    columns = zip(
+        [d.get("id") for d in docs],
+        [d.get("name") for d in docs],
+        np.where(bad_age, -1, age).astype(np.int64).tolist(),
+        np.where(male, "male", np.where(female, "female", None)).tolist(),
+        nullable(mifflin),
+        nullable(harris),
+        nullable(mifflin * activity_factor),
+        nullable(harris * activity_factor),
+        gaps.tolist(),
+    )
+    return [
+        {
+            "patientId": pid,
+            "name": name,
+            "ageYears": a if a >= 0 else None,
+            "sex": sx,
+            "bmr": {"mifflinStJeor": bmr_m, "harrisBenedict": bmr_h},
+            "tee": {"mifflinStJeor": tee_m, "harrisBenedict": tee_h},
+            "missing": list(MISSING_FIELDS[g]),
+        }
+        for pid, name, a, sx, bmr_m, bmr_h, tee_m, tee_h, g in columns
+    ]
+
+# ----------------------------------------------------------------------------
+# Bulk import
+# ----------------------------------------------------------------------------
+async def iter_body_lines(request: Request):
+    """Decode the request body incrementally and yield it line by line."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buf = ""
+    async for chunk in request.stream():
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            yield line
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield buf
+
+
+def csv_in_quotes(line: str, in_quotes: bool) -> bool:
+    """Whether a CSV record is still inside a quoted field after this line.
+
+    As in csv.reader, a quote only opens a quoted field as the field's first
+    character; anywhere else (5'10" aprox) it is plain text.
+    """
+    if '"' not in line:
+        return in_quotes
+    field_start = not in_quotes
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if in_quotes:
+            if c == '"':
+                if i + 1 < n and line[i + 1] == '"':
+                    i += 1  # escaped quote
+                else:
+                    in_quotes = False
+        elif c == ",":
+            field_start = True
+            i += 1
+            continue
+        elif c == '"' and field_start:
+            in_quotes = True
+        field_start = False
+        i += 1
+    return in_quotes
+
+
+async def iter_import_rows(request: Request):
+    """Yield (row number, raw dict or error message) from a JSON, NDJSON or CSV body.
+
+    NDJSON and CSV are parsed as they stream in. A JSON array has to be read
+    whole; send NDJSON or CSV for very large files.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "text/csv":
+        header: Optional[List[str]] = None
+        pending: List[str] = []
+        pending_chars = 0
+        in_quotes = False
+        row_no = 0
+        async for line in iter_body_lines(request):
+            pending.append(line)
+            pending_chars += len(line) + 1
+            # Quoted fields may span lines; the record ends on a line that leaves no quote open
+            in_quotes = csv_in_quotes(line, in_quotes)
+            if in_quotes:
+                if pending_chars > BULK_IMPORT_MAX_RECORD_CHARS:
+                    row_no += 1
+                    yield row_no, f"Record longer than {BULK_IMPORT_MAX_RECORD_CHARS} characters (unterminated quoted field?)"
+                    pending, pending_chars, in_quotes = [], 0, False
+                continue
+            record = "\n".join(pending).rstrip("\r")
+            pending, pending_chars = [], 0
+            if not record.strip():
+                continue
+            values = next(csv.reader([record]))
+            if header is None:
+                header = [h.strip() for h in values]
+                continue
+            row_no += 1
+            yield row_no, {k: v.strip() for k, v in zip(header, values) if k and v.strip()}
+        if pending:
+            yield row_no + 1, "Unterminated quoted field"
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        row_no = 0
+        async for line in iter_body_lines(request):
+            if not line.strip():
+                continue
+            row_no += 1
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = f"Invalid JSON: {e}"
+            yield row_no, row
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(400, "Body must be a JSON array of patients")
+        if not isinstance(rows, list):
+            raise HTTPException(400, "Body must be a JSON array of patients")
+        for row_no, row in enumerate(rows, start=1):
+            yield row_no, row
+
+
+def format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors())
+
+# ----------------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------------
+async def iter_export_lines(owner_id: str):
+    """NDJSON lines of everything a nutritionist owns, read through batched cursors."""
+    sources = [
+        ("patient", db.patients, {"ownerId": owner_id}),
+        ("prescription", db.prescriptions, {"ownerId": owner_id}),
+        ("invite", db.invites, {"nutritionistId": owner_id}),
+    ]
+    for kind, coll, flt in sources:
+        cursor = coll.find(flt, DOC_PROJECTION).sort([("createdAt", DESCENDING), ("id", DESCENDING)]).batch_size(EXPORT_BATCH_SIZE)
+        async for doc in cursor:
+            yield json_bytes({"type": kind, "data": doc}) + b"\n"
+
+
+async def iter_export_chunks(owner_id: str, compress: bool):
+    """Group export lines into ~EXPORT_CHUNK_BYTES chunks, gzipped if asked.
+
+    Memory stays at one cursor batch plus one chunk. Compression runs in a
+    worker thread (zlib releases the GIL) so big exports do not stall the loop.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    buf: List[bytes] = []
+    size = 0
+    async for line in iter_export_lines(owner_id):
+        buf.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            data = b"".join(buf)
+            buf, size = [], 0
+            yield await asyncio.to_thread(compressor.compress, data) if compressor else data
+    data = b"".join(buf)
+    if compressor:
+        yield await asyncio.to_thread(compressor.compress, data) + compressor.flush()
+    elif data:
+        yield data
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows gzip; an explicit gzip entry
+    wins over *, and q=0 refuses."""
+    weights: Dict[str, float] = {}
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.partition(";")
+        q = params.strip().removeprefix("q=").strip() or "1"
+        try:
+            weights[coding.strip()] = float(q)
+        except ValueError:
+            weights[coding.strip()] = 0.0
+    return weights.get("gzip", weights.get("*", 0.0)) > 0
+
+# ----------------------------------------------------------------------------
+# Dashboard counters
+# ----------------------------------------------------------------------------
+# One document per nutritionist in db.dashboard_counters (_id = their id):
+#   {"patients": n, "prescriptions": {status: n}, "invites": {status: n}}
+# Invite counts follow the stored status, so an invite that passed its
+# expiresAt counts as active until the sweeper marks it expired.
+async def bump_dashboard(owner_id: str, deltas: Dict[str, int]) -> None:
+    """Apply count changes (dotted paths, e.g. "invites.used") after a write.
+
+    The write being counted has already happened, so a failure here is logged
+    rather than failing the request; GET /dashboard?live=true shows the truth.
+    """
+    incs = {k: v for k, v in deltas.items() if v}
+    if not incs:
+        return
+    try:
+        await db.dashboard_counters.update_one(
+            {"_id": owner_id}, {"$inc": incs, "$set": {"updatedAt": now_iso()}}, upsert=True,
+        )
+    except PyMongoError:
+        logger.exception("Could not update dashboard counters of %s", owner_id)
+
+async def count_dashboard(owner_id: Optional[str] = None, now: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Dashboard counts recomputed from the collections, keyed by owner id.
+
+    One grouped aggregation per collection, run concurrently. owner_id=None
+    counts every nutritionist. With now, active invites past their expiresAt
+    count as expired, as invite_status reports them.
+    """
+    def owned(field: str) -> List[Dict[str, Any]]:
+        return [{"$match": {field: owner_id}}] if owner_id else []
+
+    invite_status_expr: Any = "$status"
+    if now:
+        invite_status_expr = {"$cond": [
+            {"$and": [{"$eq": ["$status", "active"]}, {"$gt": ["$expiresAt", None]}, {"$lt": ["$expiresAt", now]}]},
+            "expired",
+            "$status",
+        ]}
+    patients, prescriptions, invites = await asyncio.gather(
+        db.patients.aggregate(owned("ownerId") + [
+            {"$group": {"_id": "$ownerId", "n": {"$sum": 1}}},
+        ]).to_list(length=None),
+        db.prescriptions.aggregate(owned("ownerId") + [
+            {"$group": {"_id": {"owner": "$ownerId", "status": "$status"}, "n": {"$sum": 1}}},
+        ]).to_list(length=None),
+        db.invites.aggregate(owned("nutritionistId") + [
+            {"$group": {"_id": {"owner": "$nutritionistId", "status": invite_status_expr}, "n": {"$sum": 1}}},
+        ]).to_list(length=None),
+    )
+    counts: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"patients": 0, "prescriptions": {}, "invites": {}})
+    for row in patients:
+        counts[row["_id"]]["patients"] = row["n"]
+    for key, rows, default in (("prescriptions", prescriptions, "draft"), ("invites", invites, "active")):
+        for row in rows:
+            counts[row["_id"]["owner"]][key][row["_id"].get("status") or default] = row["n"]
+    return dict(counts)
+
+# ----------------------------------------------------------------------------
+# Search
+# ----------------------------------------------------------------------------
+# Patients and prescriptions store "searchKeys": every prefix of every folded
+# word of their searchable text, SEARCH_PREFIX_MIN to SEARCH_PREFIX_MAX letters
+# long, indexed after ownerId. A query word is looked up by its own prefix,
+# so a search reads the matching documents only, however large the panel.
+SEARCH_PREFIX_MIN = 2
+SEARCH_PREFIX_MAX = 8
+# What ranking reads back; keep in step with the *_search_fields functions
+PATIENT_SEARCH_PROJECTION = {"_id": 0, "id": 1, "name": 1, "email": 1, "notes": 1}
+PRESCRIPTION_SEARCH_PROJECTION = {"_id": 0, "id": 1, "patientId": 1, "title": 1, "status": 1, "meals.items.description": 1}
+
+
+def patient_search_fields(doc: Dict[str, Any]) -> List[Tuple[int, str]]:
+    """(weight, text) of each searchable patient field."""
+    return [(3, doc.get("name") or ""), (2, doc.get("email") or ""), (1, doc.get("notes") or "")]
+
+
+def prescription_search_fields(doc: Dict[str, Any]) -> List[Tuple[int, str]]:
+    items = " ".join(
+        item.get("description") or ""
+        for meal in doc.get("meals") or [] for item in meal.get("items") or []
+    )
+    return [(3, doc.get("title") or ""), (1, items)]
+
+
+def search_keys(fields: List[Tuple[int, str]]) -> List[str]:
+    keys = set()
+    for _, text in fields:
+        for word in fold_words(text):
+            keys.update(word[:n] for n in range(SEARCH_PREFIX_MIN, min(len(word), SEARCH_PREFIX_MAX) + 1))
+    return sorted(keys)
+
+
+def patient_search_doc(doc: Dict[str, Any]) -> Dict[str, List[str]]:
+    """searchKeys of a patient, plus notesKeys (the notes' own keys) so an
+    update that leaves notes out can union them back in without a read."""
+    return {
+        "searchKeys": search_keys(patient_search_fields(doc)),
+        "notesKeys": search_keys([(1, doc.get("notes") or "")]),
+    }
+
+
+def prescription_search_doc(doc: Dict[str, Any]) -> Dict[str, List[str]]:
+    return {"searchKeys": search_keys(prescription_search_fields(doc))}
+
+
+def search_score(fields: List[Tuple[int, str]], terms: List[str]) -> int:
+    """Sum over query words of the heaviest field holding a word that starts
+    with it, doubled for a whole-word match; 0 when a word matches nowhere
+    (possible for words longer than SEARCH_PREFIX_MAX)."""
+    folded = [(weight, fold_words(text)) for weight, text in fields]
+    score = 0
+    for term in terms:
+        best = 0
+        for weight, words in folded:
+            for word in words:
+                if word.startswith(term):
+                    best = max(best, weight * 2 if word == term else weight)
+        if not best:
+            return 0
+        score += best
+    return score
+
+
+async def search_collection(coll, owner_id: str, terms: List[str], projection: Dict[str, Any], fields) -> List[Tuple[int, Dict[str, Any]]]:
+    """(score, doc) for the owner's documents matching every term, unsorted."""
+    # Longest keys first: the index bounds come from the first, the most selective
+    keys = sorted({t[:SEARCH_PREFIX_MAX] for t in terms}, key=len, reverse=True)
+    docs = await coll.find({"ownerId": owner_id, "searchKeys": {"$all": keys}}, projection).limit(
+        SEARCH_CANDIDATES_MAX
+    ).to_list(length=SEARCH_CANDIDATES_MAX)
+    scored = ((search_score(fields(d), terms), d) for d in docs)
+    return [(score, d) for score, d in scored if score]
+
+# ----------------------------------------------------------------------------
+# Background tasks
+# ----------------------------------------------------------------------------
+async def expire_invites() -> int:
+    """Mark past-due invites expired, one update per nutritionist so their
+    dashboard counters move by exactly what changed."""
+    # Only owner ids are grouped, so the first sweep over years of invites
+    # stays small; the fixed cutoff keeps every update to the same set
+    cutoff = now_iso()
+    due = await db.invites.aggregate([
+        {"$match": {"status": "active", "expiresAt": {"$lt": cutoff}}},
+        {"$group": {"_id": "$nutritionistId"}},
+    ]).to_list(length=None)
+    expired = 0
+    for row in due:
+        result = await db.invites.update_many(
+            {"nutritionistId": row["_id"], "status": "active", "expiresAt": {"$lt": cutoff}},
+            {"$set": {"status": "expired"}},
+        )
+        await bump_dashboard(row["_id"], {"invites.active": -result.modified_count, "invites.expired": result.modified_count})
+        expired += result.modified_count
+    return expired
+
+async def invite_expiry_sweeper():
+    """Persist expiry for past-due invites so reads never have to write."""
+    while True:
+        try:
+            expired = await expire_invites()
+            if expired:
+                logger.info("Marked %d invites as expired", expired)
+        except Exception:
+            logger.exception("Invite expiry sweep failed")
+        await asyncio.sleep(INVITE_SWEEP_INTERVAL_SECONDS)
+
 # ----------------------------------------------------------------------------
 # Routes
 # ----------------------------------------------------------------------------
@@ -214,21 +2259,27 @@ async def root():
 
 # Auth
 @api.post("/auth/login", response_model=TokenResponse)
+@query_budget(1)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     email = form_data.username.lower()
     password = form_data.password
     user = await db.users.find_one({"email": email})
-    if not user or not verify_password(password, user.get("passwordHash", "")):
+    if not user or not await verify_password_async(password, user.get("passwordHash", "")):
         raise HTTPException(status_code=400, detail="Invalid credentials")
-    token = create_access_token({"sub": user["id"], "role": user["role"]})
+    claims = {"sub": user["id"], "role": user["role"]}
+    if user.get("patientId"):
+        claims["patientId"] = user["patientId"]
+    token = create_access_token(claims)
     return TokenResponse(access_token=token)
 
 @api.get("/me", response_model=UserOut)
+@query_budget(1)
 async def me(user=Depends(get_current_user)):
     return UserOut(**to_doc_id(user))
 
 # Patients
 @api.post("/patients", response_model=PatientOut)
+@query_budget(3)
 async def create_patient(payload: PatientCreate, user=Depends(require_role('nutritionist'))):
     now = now_iso()
     doc = {
@@ -238,41 +2289,131 @@ async def create_patient(payload: PatientCreate, user=Depends(require_role('nutr
         "createdAt": now,
         "updatedAt": now,
     }
+    doc.update(patient_search_doc(doc))
     await db.patients.insert_one(doc)
+    await bump_dashboard(user["id"], {"patients": 1})
     return PatientOut(**doc)
 
-@api.get("/patients", response_model=List[PatientOut])
-async def list_patients(user=Depends(require_role('nutritionist'))):
-    pts = await db.patients.find({"ownerId": user["id"]}).to_list(length=None)
-    return [PatientOut(**to_doc_id(p)) for p in pts]
+@api.post("/patients/import", response_model=BulkImportResult)
+async def import_patients(request: Request, user=Depends(require_role('nutritionist'))):
+    """Create many patients from a JSON array, NDJSON or CSV (header row of
+    PatientCreate field names). Bad rows are reported, not fatal."""
+    result = BulkImportResult(received=0, inserted=0, failed=0)
+
+    def fail(row_no: int, error: str):
+        result.failed += 1
+        if len(result.errors) < BULK_IMPORT_MAX_ERRORS:
+            result.errors.append(ImportRowError(row=row_no, error=error))
+        else:
+            result.errorsTruncated = True
+
+    async def flush(batch: List[Tuple[int, Dict[str, Any]]]):
+        if not batch:
+            return
+        inserted_before = result.inserted
+        try:
+            res = await db.patients.insert_many([doc for _, doc in batch], ordered=False)
+            result.inserted += len(res.inserted_ids)
+        except BulkWriteError as e:
+            failed_at = {err["index"]: err.get("errmsg", "Write failed") for err in e.details.get("writeErrors", [])}
+            result.inserted += e.details.get("nInserted", len(batch) - len(failed_at))
+            for index, message in sorted(failed_at.items()):
+                fail(batch[index][0], message)
+        await bump_dashboard(user["id"], {"patients": result.inserted - inserted_before})
+
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    async for row_no, row in iter_import_rows(request):
+        result.received += 1
+        if isinstance(row, str):
+            fail(row_no, row)
+            continue
+        try:
+            payload = PatientCreate.model_validate(row)
+        except ValidationError as e:
+            fail(row_no, format_validation_error(e))
+            continue
+        now = now_iso()
+        doc = {
+            "id": str(uuid.uuid4()),
+            "ownerId": user["id"],
+            **payload.model_dump(exclude_none=True),
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        doc.update(patient_search_doc(doc))
+        batch.append((row_no, doc))
+        if len(batch) >= BULK_IMPORT_CHUNK_SIZE:
+            await flush(batch)
+            batch = []
+    await flush(batch)
+    return result
+
+@api.get("/patients", response_model=Union[List[PatientOut], Page[PatientOut]])
+@query_budget(3)
+async def list_patients(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user=Depends(require_role('nutritionist')),
+):
+    # Without limit/cursor, keep the original unpaginated list for old clients
+    if limit is None and cursor is None:
+        pts = await db.patients.find({"ownerId": user["id"]}, DOC_PROJECTION).to_list(length=None)
+        return respond_list(PatientOut, pts)
+    pts, next_cursor = await fetch_page(db.patients, {"ownerId": user["id"]}, limit, cursor, DOC_PROJECTION)
+    return respond_page(PatientOut, pts, next_cursor)
+
+# Declared before /patients/{patient_id} so "energy" is not taken for an id
+@api.get("/patients/energy", response_model=List[EnergyEstimateOut])
+@query_budget(4)
+async def patient_energy_estimates(
+    activity: Literal['sedentary', 'light', 'moderate', 'active', 'very_active'] = 'sedentary',
+    user=Depends(require_role('nutritionist')),
+):
+    """BMR/TEE estimates for the caller's whole patient panel in one pass."""
+    docs = await db.patients.find({"ownerId": user["id"]}, ENERGY_PROJECTION).to_list(length=None)
+    return fast_json(energy_estimates(docs, ACTIVITY_FACTORS[activity]))
 
 @api.get("/patients/{patient_id}", response_model=PatientOut)
+@query_budget(2)
 async def get_patient(patient_id: str, user=Depends(get_current_user)):
-    pt = await db.patients.find_one({"id": patient_id})
+    pt = await db.patients.find_one({"id": patient_id}, DOC_PROJECTION)
     if not pt:
         raise HTTPException(404, "Patient not found")
     if user["role"] == "nutritionist" and pt["ownerId"] != user["id"]:
         raise HTTPException(403, "Forbidden")
     if user["role"] == "patient" and user.get("patientId") != patient_id:
         raise HTTPException(403, "Forbidden")
-    return PatientOut(**to_doc_id(pt))
+    return respond_one(PatientOut, pt)
 
 @api.put("/patients/{patient_id}", response_model=PatientOut)
+@query_budget(3)
 async def update_patient(patient_id: str, payload: PatientCreate, user=Depends(require_role('nutritionist'))):
-    pt = await db.patients.find_one({"id": patient_id})
-    if not pt:
-        raise HTTPException(404, "Patient not found")
-    if pt["ownerId"] != user["id"]:
-        raise HTTPException(403, "Forbidden")
     updates = payload.model_dump(exclude_none=True)
     updates["updatedAt"] = now_iso()
-    await db.patients.update_one({"id": patient_id}, {"$set": updates})
-    pt2 = await db.patients.find_one({"id": patient_id})
-    return PatientOut(**to_doc_id(pt2))
+    # Pipeline update so the search keys are rebuilt in the same write; $literal
+    # keeps user text starting with "$" from being read as a field path
+    stage: Dict[str, Any] = {k: {"$literal": v} for k, v in updates.items()}
+    if "notes" in updates:
+        stage.update({k: {"$literal": v} for k, v in patient_search_doc(updates).items()})
+    else:
+        # Notes left out keep their stored value, and so their stored keys
+        own_keys = search_keys(patient_search_fields({**updates, "notes": None}))
+        stage["searchKeys"] = {"$setUnion": [{"$literal": own_keys}, {"$ifNull": ["$notesKeys", []]}]}
+    doc = await db.patients.find_one_and_update(
+        {"id": patient_id, "ownerId": user["id"]},
+        [{"$set": stage}],
+        projection=DOC_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        await raise_missing_or_forbidden(db.patients, patient_id, "Patient not found")
+    return PatientOut(**doc)
 
 # Prescriptions
 @api.post("/prescriptions", response_model=PrescriptionOut)
+@query_budget(4)
 async def create_prescription(payload: PrescriptionCreate, user=Depends(require_role('nutritionist'))):
+    check_food_ids(payload)
     pt = await db.patients.find_one({"id": payload.patientId})
     if not pt or pt["ownerId"] != user["id"]:
         raise HTTPException(403, "Forbidden")
@@ -281,6 +2422,7 @@ async def create_prescription(payload: PrescriptionCreate, user=Depends(require_
         "id": str(uuid.uuid4()),
         "patientId": payload.patientId,
         "nutritionistId": user["id"],
+        "ownerId": pt["ownerId"],
         "title": payload.title,
         "status": payload.status,
         "meals": [m.model_dump() for m in payload.meals],
@@ -289,61 +2431,136 @@ async def create_prescription(payload: PrescriptionCreate, user=Depends(require_
         "createdAt": now,
         "updatedAt": now,
     }
+    doc["searchKeys"] = search_keys(prescription_search_fields(doc))
     await db.prescriptions.insert_one(doc)
-    return PrescriptionOut(**doc)
-
-@api.get("/patients/{patient_id}/prescriptions", response_model=List[PrescriptionOut])
-async def list_prescriptions(patient_id: str, user=Depends(get_current_user)):
-    pt = await db.patients.find_one({"id": patient_id})
-    if not pt:
-        raise HTTPException(404, "Patient not found")
-    if user["role"] == "nutritionist" and pt["ownerId"] != user["id"]:
-        raise HTTPException(403, "Forbidden")
-    if user["role"] == "patient" and user.get("patientId") != patient_id:
-        raise HTTPException(403, "Forbidden")
-    pres = await db.prescriptions.find({"patientId": patient_id}).sort("createdAt", -1).to_list(length=None)
-    return [PrescriptionOut(**to_doc_id(p)) for p in pres]
+    await bump_dashboard(user["id"], {f"prescriptions.{doc['status']}": 1})
+    if doc["status"] == "published":
+        latest_plans.invalidate(doc["patientId"])
+    notify_plan_change(doc, "published")
+    return respond_one(PrescriptionOut, doc)
+
+@api.get("/patients/{patient_id}/prescriptions", response_model=Union[List[PrescriptionOut], Page[PrescriptionOut]])
+@query_budget(6)
+async def list_prescriptions(
+    patient_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user=Depends(get_current_principal),
+):
+    return await _list_patient_prescriptions(request, response, user, patient_id, limit, cursor, PrescriptionOut, DOC_PROJECTION)
+
+@api.get("/patients/{patient_id}/prescriptions/summary", response_model=Union[List[PrescriptionSummaryOut], Page[PrescriptionSummaryOut]])
+@query_budget(6)
+async def list_prescription_summaries(
+    patient_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user=Depends(get_current_principal),
+):
+    return await _list_patient_prescriptions(
+        request, response, user, patient_id, limit, cursor, PrescriptionSummaryOut, PRESCRIPTION_SUMMARY_PROJECTION
+    )
+
+async def _list_patient_prescriptions(request, response, user, patient_id, limit, cursor, model, projection):
+    flt = {**prescription_acl(user, patient_id), "patientId": patient_id}
+    paginated = limit is not None or cursor is not None
+    variant = f"{model.__name__}:{limit}:{cursor}"
+    if model is PrescriptionOut:
+        variant = plan_variant(variant)
+
+    async def fetch(proj):
+        if paginated:
+            return await fetch_page(db.prescriptions, flt, limit, cursor, proj)
+        return await db.prescriptions.find(flt, proj).sort("createdAt", -1).to_list(length=None), None
+
+    # Conditional requests are answered from ids and timestamps alone
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        stamps, _ = await fetch(ETAG_PROJECTION)
+        tag = etag_for(stamps, variant)
+        if stamps and etag_matches(if_none_match, tag):
+            return not_modified(tag)
+    pres, next_cursor = await fetch(projection)
+    if not pres:
+        await check_patient_access(user, patient_id)
+    result = respond_page(model, pres, next_cursor) if paginated else respond_list(model, pres)
+    return with_etag(result, response, etag_for(pres, variant))
 
 @api.get("/prescriptions/{prescription_id}", response_model=PrescriptionOut)
-async def get_prescription(prescription_id: str, user=Depends(get_current_user)):
-    p = await db.prescriptions.find_one({"id": prescription_id})
+@query_budget(4)
+async def get_prescription(prescription_id: str, request: Request, response: Response, user=Depends(get_current_principal)):
+    flt = {"id": prescription_id, **prescription_acl(user)}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        stamp = await db.prescriptions.find_one(flt, ETAG_PROJECTION)
+        if stamp and etag_matches(if_none_match, etag_for([stamp], plan_variant())):
+            return not_modified(etag_for([stamp], plan_variant()))
+    p = await db.prescriptions.find_one(flt, DOC_PROJECTION)
     if not p:
-        raise HTTPException(404, "Not found")
-    pt = await db.patients.find_one({"id": p["patientId"]})
-    if user["role"] == "nutritionist" and pt["ownerId"] != user["id"]:
-        raise HTTPException(403, "Forbidden")
-    if user["role"] == "patient" and user.get("patientId") != pt["id"]:
-        raise HTTPException(403, "Forbidden")
-    return PrescriptionOut(**to_doc_id(p))
+        await raise_missing_or_forbidden(db.prescriptions, prescription_id)
+    return with_etag(respond_one(PrescriptionOut, p), response, etag_for([p], plan_variant()))
 
 @api.put("/prescriptions/{prescription_id}", response_model=PrescriptionOut)
+@query_budget(4)
 async def update_prescription(prescription_id: str, payload: PrescriptionCreate, user=Depends(require_role('nutritionist'))):
-    p = await db.prescriptions.find_one({"id": prescription_id})
-    if not p:
-        raise HTTPException(404, "Not found")
-    if p["nutritionistId"] != user["id"]:
-        raise HTTPException(403, "Forbidden")
-    updates = payload.model_dump(exclude_none=True)
+    check_food_ids(payload)
+    # A plan cannot be moved to another patient or author; ownerId stays valid
+    updates = payload.model_dump(exclude_none=True, exclude={"patientId", "nutritionistId"})
     updates["updatedAt"] = now_iso()
-    if updates.get("status") == 'published' and not p.get("publishedAt"):
-        updates["publishedAt"] = now_iso()
-    await db.prescriptions.update_one({"id": prescription_id}, {"$set": updates})
-    p2 = await db.prescriptions.find_one({"id": prescription_id})
-    return PrescriptionOut(**to_doc_id(p2))
+    # Title and meals are always replaced, so the keys follow from the payload
+    updates["searchKeys"] = search_keys(prescription_search_fields(updates))
+    # Pipeline update so publishedAt is only stamped the first time; $literal
+    # keeps user text starting with "$" from being read as a field path
+    stage: Dict[str, Any] = {k: {"$literal": v} for k, v in updates.items()}
+    if updates.get("status") == 'published':
+        stage["publishedAt"] = {"$ifNull": ["$publishedAt", updates["updatedAt"]]}
+    # The document before the update tells the dashboard counters whether the
+    # status changed; the stored result is rebuilt from it the way $set does
+    before = await db.prescriptions.find_one_and_update(
+        {"id": prescription_id, "nutritionistId": user["id"]},
+        [{"$set": stage}],
+        projection=DOC_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not before:
+        await raise_missing_or_forbidden(db.prescriptions, prescription_id)
+    p = {**before, **updates}
+    if updates.get("status") == 'published' and before.get("publishedAt") is None:
+        p["publishedAt"] = updates["updatedAt"]
+    was = before.get("status") or "draft"
+    if p["status"] != was:
+        await bump_dashboard(user["id"], {f"prescriptions.{was}": -1, f"prescriptions.{p['status']}": 1})
+    latest_plans.invalidate(p["patientId"])
+    notify_plan_change(p, "updated", was)
+    return respond_one(PrescriptionOut, p)
 
 @api.post("/prescriptions/{prescription_id}/publish", response_model=PrescriptionOut)
+@query_budget(4)
 async def publish_prescription(prescription_id: str, user=Depends(require_role('nutritionist'))):
-    p = await db.prescriptions.find_one({"id": prescription_id})
-    if not p:
-        raise HTTPException(404, "Not found")
-    if p["nutritionistId"] != user["id"]:
-        raise HTTPException(403, "Forbidden")
     now = now_iso()
-    await db.prescriptions.update_one({"id": prescription_id}, {"$set": {"status": "published", "publishedAt": now, "updatedAt": now}})
-    p2 = await db.prescriptions.find_one({"id": prescription_id})
-    return PrescriptionOut(**to_doc_id(p2))
+    changes = {"status": "published", "publishedAt": now, "updatedAt": now}
+    before = await db.prescriptions.find_one_and_update(
+        {"id": prescription_id, "nutritionistId": user["id"]},
+        {"$set": changes},
+        projection=DOC_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not before:
+        await raise_missing_or_forbidden(db.prescriptions, prescription_id)
+    p = {**before, **changes}
+    was = before.get("status") or "draft"
+    if was != "published":
+        await bump_dashboard(user["id"], {f"prescriptions.{was}": -1, "prescriptions.published": 1})
+    latest_plans.invalidate(p["patientId"])
+    notify_plan_change(p, "published")
+    return respond_one(PrescriptionOut, p)
 
 @api.post("/prescriptions/{prescription_id}/duplicate", response_model=PrescriptionOut)
+@query_budget(4)
 async def duplicate_prescription(prescription_id: str, user=Depends(require_role('nutritionist'))):
     p = await db.prescriptions.find_one({"id": prescription_id})
     if not p:
@@ -361,22 +2578,241 @@ async def duplicate_prescription(prescription_id: str, user=Depends(require_role
         "updatedAt": now,
     }
     await db.prescriptions.insert_one(new_doc)
-    return PrescriptionOut(**to_doc_id(new_doc))
+    await bump_dashboard(user["id"], {"prescriptions.draft": 1})
+    latest_plans.invalidate(new_doc["patientId"])
+    return respond_one(PrescriptionOut, new_doc)
+
+@api.post("/prescriptions/{prescription_id}/fan-out", response_model=FanOutResult, response_model_exclude_none=True)
+@query_budget(7)
+async def fan_out_prescription(prescription_id: str, payload: PrescriptionFanOut, user=Depends(require_role('nutritionist'))):
+    """Copy a plan to many patients at once, optionally publishing the copies."""
+    p = await db.prescriptions.find_one({"id": prescription_id, "nutritionistId": user["id"]}, {"_id": 0})
+    if not p:
+        await raise_missing_or_forbidden(db.prescriptions, prescription_id)
+    patient_ids = list(dict.fromkeys(payload.patientIds))
+    owned = {
+        pt["id"]
+        async for pt in db.patients.find({"id": {"$in": patient_ids}, "ownerId": user["id"]}, {"_id": 0, "id": 1})
+    }
+    now = now_iso()
+    status_val = "published" if payload.publish else "draft"
+    base = {k: v for k, v in p.items() if k not in ("id", "patientId", "ownerId", "status", "publishedAt", "createdAt", "updatedAt")}
+    if payload.title:
+        base["title"] = payload.title
+        base["searchKeys"] = search_keys(prescription_search_fields(base))
+    docs = [
+        {
+            **base,
+            "id": str(uuid.uuid4()),
+            "patientId": pid,
+            "nutritionistId": user["id"],
+            "ownerId": user["id"],
+            "status": status_val,
+            "publishedAt": now if payload.publish else None,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        for pid in patient_ids if pid in owned
+    ]
+    failed_ids: Dict[str, str] = {}
+    if docs:
+        try:
+            await db.prescriptions.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                failed_ids[docs[err["index"]]["id"]] = err.get("errmsg", "Write failed")
+    by_patient = {d["patientId"]: d for d in docs}
+    results: List[FanOutRow] = []
+    for pid in patient_ids:
+        doc = by_patient.get(pid)
+        if doc is None:
+            results.append(FanOutRow(patientId=pid, error="Forbidden"))
+        elif doc["id"] in failed_ids:
+            results.append(FanOutRow(patientId=pid, error=failed_ids[doc["id"]]))
+        else:
+            results.append(FanOutRow(patientId=pid, prescriptionId=doc["id"]))
+            latest_plans.invalidate(pid)
+            notify_plan_change(doc, "published")
+    created = sum(1 for r in results if r.prescriptionId)
+    await bump_dashboard(user["id"], {f"prescriptions.{status_val}": created})
+    return FanOutResult(created=created, failed=len(results) - created, results=results)
 
 @api.get("/patients/{patient_id}/latest", response_model=Optional[PrescriptionOut])
-async def latest_published(patient_id: str, user=Depends(get_current_user)):
-    pt = await db.patients.find_one({"id": patient_id})
-    if not pt:
-        raise HTTPException(404, "Patient not found")
-    if user["role"] == "nutritionist" and pt["ownerId"] != user["id"]:
-        raise HTTPException(403, "Forbidden")
-    if user["role"] == "patient" and user.get("patientId") != patient_id:
-        raise HTTPException(403, "Forbidden")
-    p = await db.prescriptions.find({"patientId": patient_id, "status": "published"}).sort("publishedAt", -1).to_list(length=1)
-    return PrescriptionOut(**to_doc_id(p[0])) if p else None
+@query_budget(4)
+async def latest_published(patient_id: str, request: Request, response: Response, user=Depends(get_current_principal)):
+    flt = {**prescription_acl(user, patient_id), "patientId": patient_id, "status": "published"}
+    if_none_match = request.headers.get("if-none-match")
+    if LATEST_CACHE_ENABLED:
+        cached = await latest_plans.get(patient_id)
+        if cached is None:
+            raise HTTPException(404, "Patient not found")
+        owner_id, p = cached
+        if user["role"] == "nutritionist" and owner_id != user["id"]:
+            raise HTTPException(403, "Forbidden")
+        tag = etag_for([p] if p else [], plan_variant("latest"))
+        if etag_matches(if_none_match, tag):
+            return not_modified(tag)
+        return with_etag(respond_one(PrescriptionOut, p), response, tag)
+    if if_none_match:
+        stamp = await db.prescriptions.find(flt, ETAG_PROJECTION).sort("publishedAt", -1).limit(1).to_list(length=1)
+        if stamp and etag_matches(if_none_match, etag_for(stamp, plan_variant("latest"))):
+            return not_modified(etag_for(stamp, plan_variant("latest")))
+    p = await db.prescriptions.find(flt, DOC_PROJECTION).sort("publishedAt", -1).limit(1).to_list(length=1)
+    if not p:
+        await check_patient_access(user, patient_id)
+    return with_etag(respond_one(PrescriptionOut, p[0] if p else None), response, etag_for(p, plan_variant("latest")))
+
+@api.post("/patients/{patient_id}/events/token", response_model=StreamTokenResponse)
+@query_budget(2)
+async def plan_event_stream_token(patient_id: str, user=Depends(get_current_principal)):
+    """A short-lived token for ?access_token= on this patient's event stream."""
+    prescription_acl(user, patient_id)
+    if user["role"] == "nutritionist":
+        await check_patient_access(user, patient_id)
+    claims = {"sub": user["id"], "role": user["role"], "scope": "events", "stream": patient_id}
+    if user.get("patientId"):
+        claims["patientId"] = user["patientId"]
+    token = create_access_token(claims, timedelta(seconds=SSE_TOKEN_TTL_SECONDS))
+    return StreamTokenResponse(access_token=token, expires_in=SSE_TOKEN_TTL_SECONDS)
+
+@api.get("/patients/{patient_id}/events")
+@query_budget(2)
+async def plan_event_stream(patient_id: str, request: Request, user=Depends(get_stream_principal)):
+    """SSE stream of changes to the patient's published plan.
+
+    Sends a comment line every SSE_HEARTBEAT_SECONDS to keep proxies from
+    closing idle connections; resume with the Last-Event-ID header.
+    """
+    prescription_acl(user, patient_id)
+    if user["role"] == "nutritionist":
+        await check_patient_access(user, patient_id)
+    try:
+        last_event_id = int(request.headers["last-event-id"])
+    except (KeyError, ValueError):
+        last_event_id = None
+
+    async def stream():
+        # Subscribed only once the body is being sent: a client gone before
+        # that never starts the generator, and so could never unsubscribe
+        queue, backlog = plan_events.subscribe(patient_id, last_event_id)
+        try:
+            yield f"retry: {int(SSE_HEARTBEAT_SECONDS * 1000)}\n\n".encode()
+            for event_id, _, event, data in backlog:
+                yield format_sse(event_id, event, data)
+            while True:
+                try:
+                    event_id, _, event, data = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                yield format_sse(event_id, event, data)
+        finally:
+            plan_events.unsubscribe(patient_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Search
+@api.get("/search", response_model=List[SearchHit], response_model_exclude_none=True)
+@query_budget(3)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[Literal['patient', 'prescription']] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    user=Depends(require_role('nutritionist')),
+):
+    """Patients (name, email, notes) and plans (title, meal items) of the
+    caller having a word starting with each query word, best matches first."""
+    terms = list(dict.fromkeys(t for t in fold_words(q) if len(t) >= SEARCH_PREFIX_MIN))
+    if not terms:
+        return []
+    kinds = [k for k in ('patient', 'prescription') if type in (None, k)]
+    sources = {
+        'patient': (db.patients, PATIENT_SEARCH_PROJECTION, patient_search_fields),
+        'prescription': (db.prescriptions, PRESCRIPTION_SEARCH_PROJECTION, prescription_search_fields),
+    }
+    found = await asyncio.gather(*(
+        search_collection(sources[k][0], user["id"], terms, sources[k][1], sources[k][2]) for k in kinds
+    ))
+    hits: List[Tuple[int, str, SearchHit]] = []
+    for kind, rows in zip(kinds, found):
+        for score, d in rows:
+            if kind == 'patient':
+                hit = SearchHit(type=kind, id=d["id"], score=score, name=d.get("name"), email=d.get("email"))
+            else:
+                hit = SearchHit(type=kind, id=d["id"], score=score, patientId=d.get("patientId"),
+                                title=d.get("title"), status=d.get("status"))
+            hits.append((score, fold(hit.name or hit.title or ""), hit))
+    hits.sort(key=lambda h: (-h[0], h[1]))
+    return [hit for _, _, hit in hits[:limit]]
+
+# Dashboard
+@api.get("/dashboard", response_model=DashboardOut)
+@query_budget(4)
+async def dashboard(live: bool = False, user=Depends(require_role('nutritionist'))):
+    """Patient, plan and invite counts in one read of the caller's counters.
+    live=true recomputes them from the collections instead (one aggregation
+    each), which also shows invites that expired since the last sweep."""
+    if live:
+        counts = (await count_dashboard(user["id"], now=now_iso())).get(user["id"], {})
+    else:
+        counts = await db.dashboard_counters.find_one({"_id": user["id"]}, {"_id": 0, "updatedAt": 0}) or {}
+    return DashboardOut(**counts, source="live" if live else "counters")
+
+@api.get("/export")
+async def export_data(request: Request, gzip: bool = False, user=Depends(require_role('nutritionist'))):
+    """Stream every patient, prescription and invite the caller owns as NDJSON.
+
+    ?gzip=true downloads an .ndjson.gz file; otherwise the NDJSON itself is
+    sent gzip-encoded to clients whose Accept-Encoding allows it.
+    """
+    filename = "dinutri-export.ndjson" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    encoded = not gzip and accepts_gzip(request.headers.get("accept-encoding"))
+    if encoded:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        iter_export_chunks(user["id"], gzip or encoded),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers=headers,
+    )
+
+@api.post("/prescriptions/totals", response_model=TotalsBatchResult)
+@query_budget(3)
+async def prescription_totals(payload: TotalsBatch, user=Depends(get_current_principal)):
+    """Nutrient totals for many prescriptions at once; cached plans are not recomputed."""
+    ids = list(dict.fromkeys(payload.ids))
+    plans = await db.prescriptions.find(
+        {"id": {"$in": ids}, **prescription_acl(user)}, TOTALS_PROJECTION
+    ).to_list(length=None)
+    totals = dict(zip((p["id"] for p in plans), plans_totals(plans)))
+    return fast_json({"totals": totals, "missing": [i for i in ids if i not in totals]})
+
+# Foods
+@api.get("/foods", response_model=List[FoodOut])
+@query_budget(1)
+async def search_foods(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    user=Depends(get_current_principal),
+):
+    """Autocomplete over the food-composition table, served from memory."""
+    return fast_json(food_index().search(q, limit))
+
+@api.get("/foods/{food_id}", response_model=FoodOut)
+@query_budget(1)
+async def get_food(food_id: str, user=Depends(get_current_principal)):
+    food = food_index().get(food_id)
+    if food is None:
+        raise HTTPException(404, "Food not found")
+    return fast_json(food)
 
 # Invites
 @api.post("/invites", response_model=InviteOut)
+@query_budget(3)
 async def create_invite(payload: InviteCreate, user=Depends(require_role('nutritionist'))):
     token = str(uuid.uuid4())
     expires_at = None
@@ -393,41 +2829,38 @@ async def create_invite(payload: InviteCreate, user=Depends(require_role('nutrit
         "expiresAt": expires_at,
     }
     await db.invites.insert_one(doc)
+    await bump_dashboard(user["id"], {"invites.active": 1})
     return InviteOut(**doc)
 
-@api.get("/invites", response_model=List[InviteOut])
-async def list_invites(user=Depends(require_role('nutritionist'))):
-    rows = await db.invites.find({"nutritionistId": user["id"]}).sort("createdAt", -1).to_list(length=None)
+@api.get("/invites", response_model=Union[List[InviteOut], Page[InviteOut]])
+@query_budget(3)
+async def list_invites(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user=Depends(require_role('nutritionist')),
+):
+    paginated = limit is not None or cursor is not None
+    next_cursor = None
+    if paginated:
+        rows, next_cursor = await fetch_page(db.invites, {"nutritionistId": user["id"]}, limit, cursor)
+    else:
+        rows = await db.invites.find({"nutritionistId": user["id"]}).sort("createdAt", -1).to_list(length=None)
     now = datetime.now(timezone.utc)
-    out: List[InviteOut] = []
-    for inv in rows:
-        status_val = inv.get("status", "active")
-        if status_val == "active" and inv.get("expiresAt"):
-            try:
-                if datetime.fromisoformat(inv["expiresAt"]) < now:
-                    status_val = "expired"
-                    await db.invites.update_one({"id": inv["id"]}, {"$set": {"status": "expired"}})
-            except Exception:
-                pass
-        inv["status"] = status_val
-        if not inv.get("createdAt"):
-            created_iso = now_iso()
-            inv["createdAt"] = created_iso
-            await db.invites.update_one({"id": inv["id"]}, {"$set": {"createdAt": created_iso}})
-        out.append(InviteOut(**to_doc_id(inv)))
+    out = [InviteOut(**{**to_doc_id(inv), "status": invite_status(inv, now)}) for inv in rows]
+    if paginated:
+        return Page[InviteOut](items=out, nextCursor=next_cursor)
     return out
 
 @api.get("/invites/{token}", response_model=InviteOut)
+@query_budget(1)
 async def get_invite(token: str):
     inv = await db.invites.find_one({"token": token})
     if not inv:
         raise HTTPException(404, "Invite not found")
-    if inv.get("status") == "active" and inv.get("expiresAt"):
-        if datetime.fromisoformat(inv["expiresAt"]) < datetime.now(timezone.utc):
-            inv["status"] = "expired"
-    return InviteOut(**to_doc_id(inv))
+    return InviteOut(**{**to_doc_id(inv), "status": invite_status(inv, datetime.now(timezone.utc))})
 
 @api.post("/invites/{invite_id}/revoke", response_model=InviteRevokeResponse)
+@query_budget(4)
 async def revoke_invite(invite_id: str, user=Depends(require_role('nutritionist'))):
     inv = await db.invites.find_one({"id": invite_id})
     if not inv:
@@ -436,10 +2869,14 @@ async def revoke_invite(invite_id: str, user=Depends(require_role('nutritionist'
         raise HTTPException(403, "Forbidden")
     if inv.get("status") in ("used", "revoked"):
         return InviteRevokeResponse(id=inv["id"], status=inv.get("status"))
-    await db.invites.update_one({"id": invite_id}, {"$set": {"status": "revoked"}})
+    # Conditional on the status read above so a racing sweep or accept is not counted twice
+    result = await db.invites.update_one({"id": invite_id, "status": inv.get("status")}, {"$set": {"status": "revoked"}})
+    if result.modified_count:
+        await bump_dashboard(user["id"], {f"invites.{inv.get('status', 'active')}": -1, "invites.revoked": 1})
     return InviteRevokeResponse(id=invite_id, status="revoked")
 
 @api.post("/invites/{token}/accept", response_model=UserOut)
+@query_budget(5)
 async def accept_invite(token: str, payload: Dict[str, Any]):
     inv = await db.invites.find_one({"token": token})
     if not inv:
@@ -447,7 +2884,8 @@ async def accept_invite(token: str, payload: Dict[str, Any]):
     if inv.get("status") != "active":
         raise HTTPException(400, "Invite not active")
     if inv.get("expiresAt") and datetime.fromisoformat(inv["expiresAt"]) < datetime.now(timezone.utc):
-        await db.invites.update_one({"id": inv["id"]}, {"$set": {"status": "expired"}})
+        result = await db.invites.update_one({"id": inv["id"], "status": "active"}, {"$set": {"status": "expired"}})
+        await bump_dashboard(inv["nutritionistId"], {"invites.active": -result.modified_count, "invites.expired": result.modified_count})
         raise HTTPException(400, "Invite expired")
 
     now = now_iso()
@@ -456,7 +2894,7 @@ async def accept_invite(token: str, payload: Dict[str, Any]):
         "role": "patient",
         "name": payload.get("name"),
         "email": inv["email"],
-        "passwordHash": get_password_hash(payload.get("password")),
+        "passwordHash": await hash_password_async(payload.get("password")),
         "createdAt": now,
         "updatedAt": now,
     }
@@ -475,27 +2913,195 @@ async def accept_invite(token: str, payload: Dict[str, Any]):
         "createdAt": now,
         "updatedAt": now,
     }
+    patient_doc.update(patient_search_doc(patient_doc))
 
     await db.patients.insert_one(patient_doc)
     patient_user["patientId"] = patient_doc["id"]
     await db.users.insert_one(patient_user)
-    await db.invites.update_one({"id": inv["id"]}, {"$set": {"status": "used"}})
+    invalidate_user(patient_user["id"])
+    result = await db.invites.update_one({"id": inv["id"], "status": "active"}, {"$set": {"status": "used"}})
+    await bump_dashboard(inv["nutritionistId"], {
+        "patients": 1, "invites.active": -result.modified_count, "invites.used": result.modified_count,
+    })
 
     return UserOut(**to_doc_id(patient_user))
 
-# Include router
-app.include_router(api)
+def _label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+
+    def header(name: str, kind: str, doc: str):
+        lines.append(f"# HELP {name} {doc}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    header("dinutri_http_requests_total", "counter", "HTTP responses by route and status.")
+    for (method, route, code), n in sorted(metrics.responses.items()):
+        lines.append(f'dinutri_http_requests_total{{method="{method}",route="{_label(route)}",status="{code}"}} {n}')
+    header("dinutri_http_requests_in_flight", "gauge", "Requests currently being served.")
+    for (method, route), n in sorted(metrics.in_flight.items()):
+        lines.append(f'dinutri_http_requests_in_flight{{method="{method}",route="{_label(route)}"}} {n}')
+    header("dinutri_http_request_duration_seconds", "histogram", "Request latency.")
+    for (method, route), h in sorted(metrics.latency.items()):
+        lines += h.render("dinutri_http_request_duration_seconds", f'method="{method}",route="{_label(route)}"')
+    header("dinutri_http_request_db_commands", "histogram", "Mongo commands issued per request.")
+    for (method, route), h in sorted(metrics.db_commands.items()):
+        lines += h.render("dinutri_http_request_db_commands", f'method="{method}",route="{_label(route)}"')
+    header("dinutri_http_request_db_seconds_total", "counter", "Time spent in Mongo commands per route.")
+    for (method, route), v in sorted(metrics.db_seconds.items()):
+        lines.append(f'dinutri_http_request_db_seconds_total{{method="{method}",route="{_label(route)}"}} {v}')
+    header("dinutri_query_budget_exceeded_total", "counter", "Requests that made more Mongo round trips than their route allows.")
+    for (method, route), n in sorted(metrics.budget_exceeded.items()):
+        lines.append(f'dinutri_query_budget_exceeded_total{{method="{method}",route="{_label(route)}"}} {n}')
+    by_command = command_metrics.snapshot()
+    header("dinutri_mongo_commands_total", "counter", "Mongo commands by name.")
+    for command, (n, _, _) in by_command:
+        lines.append(f'dinutri_mongo_commands_total{{command="{_label(command)}"}} {n}')
+    header("dinutri_mongo_command_failures_total", "counter", "Failed Mongo commands by name.")
+    for command, (_, failures, _) in by_command:
+        lines.append(f'dinutri_mongo_command_failures_total{{command="{_label(command)}"}} {failures}')
+    header("dinutri_mongo_command_seconds_total", "counter", "Time spent in Mongo commands by name.")
+    for command, (_, _, seconds) in by_command:
+        lines.append(f'dinutri_mongo_command_seconds_total{{command="{_label(command)}"}} {seconds}')
+    header("dinutri_cache", "gauge", "In-process cache statistics.")
+    for cache_name, stats in (("user", user_cache.stats()), ("latest_plan", latest_plans.stats()),
+                              ("nutrient_totals", nutrient_cache.stats())):
+        for stat, value in stats.items():
+            lines.append(f'dinutri_cache{{cache="{cache_name}",stat="{stat}"}} {value}')
+    header("dinutri_password_hash_pool", "gauge", "bcrypt worker pool statistics.")
+    for stat, value in hash_pool.stats().items():
+        lines.append(f'dinutri_password_hash_pool{{stat="{stat}"}} {value}')
+    header("dinutri_mongo_pool", "gauge", "Mongo connection pool usage.")
+    for stat, value in pool_metrics.stats().items():
+        lines.append(f'dinutri_mongo_pool{{stat="{stat}"}} {value}')
+    header("dinutri_sse_connections", "gauge", "Open plan event streams.")
+    lines.append(f"dinutri_sse_connections {plan_events.connections}")
+    return "\n".join(lines) + "\n"
+
+
+@ops.get("/metrics")
+async def metrics_endpoint(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@ops.get("/healthz")
+@query_budget(0)
+async def healthz():
+    """Liveness: the process answers. Never touches Mongo, so a database
+    outage does not get healthy workers restarted."""
+    return {"status": "ok", "pool": pool_metrics.stats()}
+
+
+@ops.get("/readyz")
+@query_budget(1)
+async def readyz(request: Request):
+    """Readiness: startup and warm-up finished and Mongo answers a ping."""
+    body: Dict[str, Any] = {"status": "ready", "pool": pool_metrics.stats(), "passwordHashPool": hash_pool.stats()}
+    if not request.app.state.ready:
+        body["status"] = "not_ready"
+    else:
+        try:
+            await asyncio.wait_for(db.command("ping"), READY_PING_TIMEOUT_SECONDS)
+        except (PyMongoError, asyncio.TimeoutError) as e:
+            body["status"] = "unavailable"
+            body["error"] = str(e) or type(e).__name__
+    code = 200 if body["status"] == "ready" else status.HTTP_503_SERVICE_UNAVAILABLE
+    return Response(json_bytes(body), status_code=code, media_type="application/json")
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-
-@app.on_event("startup")
-async def on_startup():
-    await seed_default_nutritionist()
-
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# ----------------------------------------------------------------------------
+# App factory
+# ----------------------------------------------------------------------------
+class AppServices:
+    """The in-process state one app keeps next to its database.
+
+    Each app gets its own (app.state.services), so one app shutting down its
+    hash pool, or caching users and plans, never touches another's.
+    """
+
+    def __init__(self):
+        self.hash_pool = PasswordHashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+        self.user_cache = TTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+        self.latest_plans = SingleFlightCache(load_latest_plan, LATEST_CACHE_MAX_ENTRIES, LATEST_CACHE_TTL_SECONDS)
+        self.nutrient_cache = TTLCache(NUTRIENT_CACHE_MAX_ENTRIES, float("inf"))
+        self.plan_events = PlanEventBroker(SSE_HISTORY_SIZE, SSE_QUEUE_SIZE)
+
+
+default_services = AppServices()
+
+
+async def warm_up(settings: Settings) -> None:
+    # Concurrent pings check out (and so open) that many pooled connections
+    await asyncio.gather(*(db.command("ping") for _ in range(max(1, settings.mongo_min_pool_size))))
+    await hash_pool.warm_up()
+    food_index()
+
+
+def create_app(settings: Optional[Settings] = None, services: Optional[AppServices] = None) -> FastAPI:
+    """Build the app. Nothing connects until its lifespan starts, so importing
+    this module is cheap and tests can build apps with their own settings."""
+    settings = settings or Settings()
+    services = services or AppServices()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        settings.check()
+        app.state.client = client = connect(settings)
+        app.state.db = client[settings.db_name]
+        # Startup work and the tasks created below run against this app's database
+        bound = current_app_db.set(app.state.db)
+        bound_services = current_app_services.set(services)
+        background_tasks: List[asyncio.Task] = []
+        try:
+            await ensure_indexes()
+            await run_migrations()
+            await seed_default_nutritionist()
+            failures = await verify_query_plans()
+            for route, stages in failures.items():
+                logger.error("Query for %s is not using an index: %s", route, " <- ".join(stages))
+            if failures and INDEX_STRICT:
+                raise RuntimeError(f"Unindexed queries: {', '.join(sorted(failures))}")
+            start = time.perf_counter()
+            await warm_up(settings)
+            logger.info("Warm-up done in %.0f ms: %s", (time.perf_counter() - start) * 1000, pool_metrics.stats())
+            background_tasks.append(asyncio.create_task(invite_expiry_sweeper()))
+            app.state.ready = True
+            yield
+        finally:
+            app.state.ready = False
+            for task in background_tasks:
+                task.cancel()
+            app.state.db = None
+            current_app_services.reset(bound_services)
+            current_app_db.reset(bound)
+            client.close()
+            services.hash_pool.shutdown()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.state.client = app.state.db = None
+    app.state.services = services
+    app.state.ready = False
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=settings.cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag"],
+    )
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(DatabaseMiddleware)
+    app.include_router(api)
+    app.include_router(ops)
+    return app
+
+
+app = create_app(services=default_services)
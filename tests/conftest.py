@@ -0,0 +1,56 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend-python"))
+os.environ.setdefault("JWT_SECRET", "test-secret-" + "x" * 32)
+
+# Query budgets need a real mongod: MONGO_TEST_URL=mongodb://localhost:27017
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL")
+
+pytest_plugins = ["tests.query_budget"]
+
+PASSWORD = "password123"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def memory_server(monkeypatch):
+    """The server module on an empty in-memory database (mongomock-motor).
+
+    Behaviour tests run on this by default. Its operations are charged to
+    query budgets (see tests/query_budget.py); it has no explain() or $merge,
+    so plan checks stay on MONGO_TEST_URL.
+    """
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+    from tests.query_budget import count_in_memory_round_trips
+
+    count_in_memory_round_trips(monkeypatch, server)
+
+    previous = server.db.use(mongomock_motor.AsyncMongoMockClient()["dinutri_test"])
+    server.user_cache.clear()
+    server.latest_plans._cache.clear()
+    server.nutrient_cache.clear()
+    yield server
+    server.db.use(previous)
+
+
+@pytest.fixture
+async def api(memory_server):
+    """An httpx client on the app plus the default nutritionist's auth header."""
+    import httpx
+
+    await memory_server.seed_default_nutritionist()
+    transport = httpx.ASGITransport(app=memory_server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as cl:
+        r = await cl.post("/api/auth/login", data={"username": "pro@dinutri.app", "password": PASSWORD})
+        assert r.status_code == 200
+        cl.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+        yield cl
@@ -0,0 +1,88 @@
+"""pytest plugin enforcing the per-route Mongo query budgets declared in server.py.
+
+Turns on QUERY_BUDGET_STRICT, so a request that makes more round trips than
+its route's @query_budget raises QueryBudgetExceeded out of the app and fails
+the test that sent it. Against a mongod, round trips are counted from
+pymongo command events. The in-memory stand-in (mongomock-motor) emits none,
+so count_in_memory_round_trips charges each of its operations to the request
+instead: one per call, or per cursor read. That misses the getMores a real
+server needs for big results, so in-memory counts are a lower bound.
+"""
+import functools
+import os
+import sys
+
+# Operations of mongomock-motor that stand for one round trip each
+IN_MEMORY_ROUND_TRIPS = {
+    "AsyncMongoMockCollection": (
+        "bulk_write", "count_documents", "delete_many", "delete_one", "distinct", "estimated_document_count",
+        "find_one", "find_one_and_delete", "find_one_and_replace", "find_one_and_update", "insert_many",
+        "insert_one", "replace_one", "update_many", "update_one",
+    ),
+    "AsyncMongoMockDatabase": ("command",),
+}
+IN_MEMORY_CURSORS = ("AsyncCursor", "AsyncCommandCursor", "AsyncLatentCommandCursor")
+
+
+def pytest_configure(config):
+    os.environ["QUERY_BUDGET_STRICT"] = "1"
+    server = sys.modules.get("server")
+    if server is not None:
+        server.QUERY_BUDGET_STRICT = True
+
+
+def pytest_terminal_summary(terminalreporter):
+    server = sys.modules.get("server")
+    if server is None or not server.metrics.db_commands:
+        return
+    terminalreporter.section("Mongo round trips per request")
+    for (method, route), h in sorted(server.metrics.db_commands.items()):
+        budget = next(
+            (getattr(r.endpoint, "query_budget", None) for r in server.app.router.routes
+             if getattr(r, "path", None) == route and method in getattr(r, "methods", ())),
+            None,
+        )
+        over = server.metrics.budget_exceeded.get((method, route), 0)
+        terminalreporter.write_line(
+            f"{method:<7}{route:<50} mean {h.sum / h.count:5.2f}  budget {budget if budget is not None else '-':>2}"
+            + (f"  OVER x{over}" if over else "")
+        )
+
+
+def _charge(server):
+    stats = server.current_request_db.get()
+    if stats is not None:
+        stats.commands += 1
+
+
+def count_in_memory_round_trips(monkeypatch, server):
+    """Charge mongomock-motor operations to the request making them."""
+    import mongomock_motor
+
+    for cls_name, methods in IN_MEMORY_ROUND_TRIPS.items():
+        cls = getattr(mongomock_motor, cls_name)
+        for name in methods:
+            monkeypatch.setattr(cls, name, _counted(getattr(cls, name), server))
+    for cls_name in IN_MEMORY_CURSORS:
+        cls = getattr(mongomock_motor, cls_name)
+        monkeypatch.setattr(cls, "to_list", _counted(cls.to_list, server))
+        monkeypatch.setattr(cls, "next", _first_read_counted(cls.next, server))
+        monkeypatch.setattr(cls, "__anext__", cls.next)
+
+
+def _counted(method, server):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        _charge(server)
+        return await method(*args, **kwargs)
+    return wrapper
+
+
+def _first_read_counted(method, server):
+    @functools.wraps(method)
+    async def wrapper(cursor):
+        if not cursor.__dict__.get("_read"):
+            cursor.__dict__["_read"] = True
+            _charge(server)
+        return await method(cursor)
+    return wrapper
@@ -0,0 +1,83 @@
+"""Apps built by create_app keep their own database and services, so several can share a process."""
+import asyncio
+
+import httpx
+import pytest
+
+from tests.conftest import PASSWORD
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def server(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import server
+
+    monkeypatch.setattr(server, "connect", lambda settings: mongomock_motor.AsyncMongoMockClient())
+    # mongomock has no explain() or $merge
+    monkeypatch.setattr(server, "verify_query_plans", skipped)
+    monkeypatch.setattr(server, "run_migrations", skipped)
+    server.user_cache.clear()
+    return server
+
+
+async def skipped():
+    return {}
+
+
+async def login(cl):
+    r = await cl.post("/api/auth/login", data={"username": "pro@dinutri.app", "password": PASSWORD})
+    assert r.status_code == 200
+    cl.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+
+
+async def test_two_apps_do_not_share_a_database(server):
+    apps = [server.create_app(server.Settings(mongo_url="mongodb://x", db_name=name)) for name in ("one", "two")]
+    async with apps[0].router.lifespan_context(apps[0]), apps[1].router.lifespan_context(apps[1]):
+        clients = [httpx.AsyncClient(transport=httpx.ASGITransport(app=a), base_url="http://test") for a in apps]
+        for cl in clients:
+            await login(cl)
+        await clients[0].post("/api/patients", json={"name": "Only in one", "email": "one@x.com"})
+
+        assert [p["name"] for p in (await clients[0].get("/api/patients")).json()] == ["Only in one"]
+        assert (await clients[1].get("/api/patients")).json() == []
+        assert (await apps[1].state.db.patients.count_documents({})) == 0
+        for cl in clients:
+            await cl.aclose()
+
+    # Shutting one app down leaves the other serving
+    async with apps[1].router.lifespan_context(apps[1]):
+        second = apps[1].state.db
+        async with apps[0].router.lifespan_context(apps[0]):
+            pass
+        assert apps[0].state.db is None and apps[1].state.db is second
+        assert server.db.current() is second
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=apps[1]), base_url="http://test") as cl:
+            await login(cl)
+            assert (await cl.get("/api/patients")).status_code == 200
+
+
+async def test_closing_one_app_leaves_the_others_logins_running(server):
+    apps = [server.create_app(server.Settings(mongo_url="mongodb://x", db_name=name)) for name in ("one", "two")]
+    assert apps[0].state.services.hash_pool is not apps[1].state.services.hash_pool
+    async with apps[1].router.lifespan_context(apps[1]):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=apps[1]), base_url="http://test") as cl:
+            await login(cl)
+            async with apps[0].router.lifespan_context(apps[0]):
+                # More logins than hash workers, so some wait in the pool's queue
+                logins = [asyncio.ensure_future(login(cl)) for _ in range(3 * server.PASSWORD_HASH_WORKERS)]
+                while not apps[1].state.services.hash_pool.pending:
+                    await asyncio.sleep(0)
+            await asyncio.gather(*logins)
+            assert (await cl.get("/api/patients")).status_code == 200
+    assert [a.state.services.user_cache.stats()["size"] for a in apps] == [0, 1]
+
+
+async def test_no_database_outside_an_app(server):
+    previous = server.db.use(None)
+    try:
+        with pytest.raises(RuntimeError, match="No database"):
+            server.db.users
+    finally:
+        server.db.use(previous)
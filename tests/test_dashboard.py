@@ -0,0 +1,81 @@
+"""The incremental dashboard counters agree with a live recount after every write route."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def assert_counters_match(api, step: str) -> dict:
+    counters = (await api.get("/api/dashboard")).json()
+    live = (await api.get("/api/dashboard", params={"live": "true"})).json()
+    assert (counters.pop("source"), live.pop("source")) == ("counters", "live")
+    assert counters == live, step
+    return counters
+
+
+async def test_counters_follow_every_write(api, memory_server):
+    await assert_counters_match(api, "empty")
+
+    pids = []
+    for i in range(3):
+        r = await api.post("/api/patients", json={"name": f"P{i}", "email": f"p{i}@x.com"})
+        pids.append(r.json()["id"])
+    await assert_counters_match(api, "create patient")
+
+    csv_body = "name,email\nA,a@x.com\nB,not-an-email\nC,c@x.com\n"
+    r = await api.post("/api/patients/import", content=csv_body, headers={"Content-Type": "text/csv"})
+    assert r.json()["inserted"] == 2
+    counts = await assert_counters_match(api, "import patients")
+    assert counts["patients"] == 5
+
+    body = {"patientId": pids[0], "title": "Plan", "meals": []}
+    draft = (await api.post("/api/prescriptions", json=body)).json()
+    published = (await api.post("/api/prescriptions", json={**body, "status": "published"})).json()
+    await assert_counters_match(api, "create prescription")
+
+    await api.put(f"/api/prescriptions/{draft['id']}", json={**body, "title": "Renamed"})
+    await assert_counters_match(api, "update without status change")
+    await api.put(f"/api/prescriptions/{published['id']}", json=body)  # back to draft
+    await assert_counters_match(api, "update to draft")
+
+    await api.post(f"/api/prescriptions/{draft['id']}/publish")
+    await api.post(f"/api/prescriptions/{draft['id']}/publish")  # already published
+    await assert_counters_match(api, "publish")
+
+    await api.post(f"/api/prescriptions/{draft['id']}/duplicate")
+    await assert_counters_match(api, "duplicate")
+
+    r = await api.post(f"/api/prescriptions/{draft['id']}/fan-out", json={"patientIds": pids + ["missing"], "publish": True})
+    assert r.json()["created"] == 3
+    counts = await assert_counters_match(api, "fan-out")
+    assert counts["prescriptions"] == {"draft": 2, "published": 4}
+
+    invites = [(await api.post("/api/invites", json={"email": f"i{i}@x.com"})).json() for i in range(4)]
+    await assert_counters_match(api, "create invite")
+
+    await api.post(f"/api/invites/{invites[0]['id']}/revoke")
+    await api.post(f"/api/invites/{invites[0]['id']}/revoke")  # already revoked
+    await assert_counters_match(api, "revoke")
+
+    r = await api.post(f"/api/invites/{invites[1]['token']}/accept", json={"name": "New", "password": "password123"})
+    assert r.status_code == 200
+    await assert_counters_match(api, "accept")
+
+    past = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    await memory_server.db.invites.update_many(
+        {"id": {"$in": [invites[2]["id"], invites[3]["id"]]}}, {"$set": {"expiresAt": past}}
+    )
+    r = await api.post(f"/api/invites/{invites[2]['token']}/accept", json={"name": "Late", "password": "password123"})
+    assert r.status_code == 400
+    assert await memory_server.expire_invites() == 1
+    counts = await assert_counters_match(api, "expiry")
+    assert counts["invites"] == {"active": 0, "used": 1, "revoked": 1, "expired": 2}
+    assert counts["patients"] == 6
+
+
+async def test_backfill_matches_live_count(api, memory_server):
+    await api.post("/api/patients", json={"name": "P", "email": "p@x.com"})
+    await memory_server.db.dashboard_counters.delete_many({})
+    await memory_server.backfill_dashboard_counters()
+    await assert_counters_match(api, "backfill")
@@ -0,0 +1,46 @@
+"""Energy estimates against values worked out by hand from the published formulas."""
+import pytest
+
+import server
+
+TODAY = "2024-06-15"
+
+
+def estimate(activity="sedentary", **patient):
+    return server.energy_estimates([{"id": "p", **patient}], server.ACTIVITY_FACTORS[activity], today=TODAY)[0]
+
+
+def test_female():
+    # MSJ: 10*60 + 6.25*165 - 5*36 - 161 = 1290.25
+    # HB:  447.593 + 9.247*60 + 3.098*165 - 4.330*36 = 1357.703
+    e = estimate("moderate", weightKg=60, heightCm=165, birthDate="1988-01-10", sex="F")
+    assert (e["ageYears"], e["sex"], e["missing"]) == (36, "female", [])
+    assert e["bmr"] == {"mifflinStJeor": 1290, "harrisBenedict": 1358}
+    assert e["tee"] == {"mifflinStJeor": 2000, "harrisBenedict": 2104}  # x 1.55
+
+
+def test_male():
+    # MSJ: 10*80 + 6.25*180 - 5*46 + 5 = 1700
+    # HB:  88.362 + 13.397*80 + 4.799*180 - 5.677*46 = 1762.8
+    e = estimate(weightKg=80, heightCm=180, birthDate="15/06/1978", sex="masculino")
+    assert (e["ageYears"], e["sex"]) == (46, "male")
+    assert e["bmr"] == {"mifflinStJeor": 1700, "harrisBenedict": 1763}
+    assert e["tee"] == {"mifflinStJeor": 2040, "harrisBenedict": 2115}  # x 1.2
+
+
+@pytest.mark.parametrize("birth, age", [
+    ("1978-06-15", 46),  # birthday today
+    ("1978-06-16", 45),  # tomorrow
+    ("1978-07-01", 45),
+    ("1978-05-31", 46),
+    ("2000-02-29", 24),
+])
+def test_age_in_completed_years(birth, age):
+    assert estimate(weightKg=80, heightCm=180, birthDate=birth, sex="m")["ageYears"] == age
+
+
+def test_missing_inputs_empty_the_estimates():
+    e = estimate(weightKg=0, heightCm="abc", birthDate="2030-01-01", sex="x")
+    assert e["missing"] == ["weightKg", "heightCm", "birthDate", "sex"]
+    assert e["bmr"] == e["tee"] == {"mifflinStJeor": None, "harrisBenedict": None}
+    assert estimate(weightKg=80, heightCm=180, sex="m")["missing"] == ["birthDate"]
@@ -0,0 +1,67 @@
+"""Plan reads answer If-None-Match with 304 until the plans behind them change."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def plans(api):
+    pid = (await api.post("/api/patients", json={"name": "P", "email": "p@x.com"})).json()["id"]
+    body = {"patientId": pid, "title": "Plan", "status": "published", "meals": []}
+    plan = (await api.post("/api/prescriptions", json=body)).json()
+    return pid, plan, body
+
+
+def paths(pid, plan_id):
+    return [
+        f"/api/prescriptions/{plan_id}",
+        f"/api/patients/{pid}/prescriptions",
+        f"/api/patients/{pid}/prescriptions?limit=10",
+        f"/api/patients/{pid}/prescriptions/summary",
+        f"/api/patients/{pid}/latest",
+    ]
+
+
+async def revalidate(api, path, tag):
+    return await api.get(path, headers={"If-None-Match": tag})
+
+
+async def test_unchanged_reads_are_not_modified(api, plans):
+    pid, plan, _ = plans
+    tags = {}
+    for path in paths(pid, plan["id"]):
+        r = await api.get(path)
+        assert r.status_code == 200 and r.headers["etag"].startswith('"'), path
+        tags[path] = r.headers["etag"]
+        for header in (tags[path], f"W/{tags[path]}", f'"other", {tags[path]}', "*"):
+            r = await revalidate(api, path, header)
+            assert (r.status_code, r.headers["etag"], r.content) == (304, tags[path], b""), (path, header)
+        assert (await revalidate(api, path, '"other"')).status_code == 200
+    # Full and summary listings of the same rows are different representations
+    assert len(set(tags.values())) == len(tags)
+
+
+@pytest.mark.parametrize("latest_cache", [True, False])
+async def test_writes_change_the_tags(api, memory_server, monkeypatch, plans, latest_cache):
+    monkeypatch.setattr(memory_server, "LATEST_CACHE_ENABLED", latest_cache)
+    pid, plan, body = plans
+    tags = {path: (await api.get(path)).headers["etag"] for path in paths(pid, plan["id"])}
+
+    await api.put(f"/api/prescriptions/{plan['id']}", json={**body, "title": "Renamed"})
+    for path, tag in tags.items():
+        r = await revalidate(api, path, tag)
+        assert r.status_code == 200 and r.headers["etag"] != tag, path
+        tags[path] = r.headers["etag"]
+
+    # A new draft changes the listings but not the single plan or the latest
+    await api.post("/api/prescriptions", json={**body, "status": "draft"})
+    changed = {path for path, tag in tags.items() if (await revalidate(api, path, tag)).status_code == 200}
+    assert changed == set(paths(pid, plan["id"])[1:4])
+
+
+async def test_no_tag_matches_for_missing_plans(api, plans):
+    pid, _, _ = plans
+    r = await api.get("/api/prescriptions/missing", headers={"If-None-Match": "*"})
+    assert r.status_code == 404
+    r = await api.get("/api/patients/missing/latest", headers={"If-None-Match": "*"})
+    assert r.status_code == 404
@@ -0,0 +1,75 @@
+"""The export streams the caller's data, and only theirs, as NDJSON, gzipped on request."""
+import gzip
+import json
+
+import pytest
+
+from tests.conftest import PASSWORD
+
+pytestmark = pytest.mark.anyio
+
+PLAIN = {"Accept-Encoding": "identity"}
+
+
+@pytest.fixture
+async def data(api, memory_server):
+    pids = [(await api.post("/api/patients", json={"name": f"P{i}", "email": f"p{i}@x.com"})).json()["id"]
+            for i in range(3)]
+    plans = [(await api.post("/api/prescriptions", json={"patientId": pid, "title": "Plan", "meals": [
+        {"name": "Lunch", "items": [{"description": "Rice"}]}]})).json()["id"] for pid in pids]
+    invite = (await api.post("/api/invites", json={"email": "new@x.com"})).json()["id"]
+    # Someone else's rows, which must not leak into the export
+    await memory_server.db.patients.insert_one({"id": "theirs", "ownerId": "other", "name": "X", "createdAt": "2024"})
+    await memory_server.db.prescriptions.insert_one({"id": "their-plan", "ownerId": "other", "patientId": "theirs"})
+    await memory_server.db.invites.insert_one({"id": "their-invite", "nutritionistId": "other", "token": "t"})
+    return {"patient": pids[::-1], "prescription": plans[::-1], "invite": [invite]}
+
+
+def parse(body: bytes) -> list:
+    assert body.endswith(b"\n")
+    return [json.loads(line) for line in body.split(b"\n")[:-1]]
+
+
+async def test_ndjson_of_the_callers_rows_only(api, memory_server, monkeypatch, data):
+    # Tiny chunks, so lines are grouped across many of them
+    monkeypatch.setattr(memory_server, "EXPORT_CHUNK_BYTES", 100)
+    monkeypatch.setattr(memory_server, "EXPORT_BATCH_SIZE", 2)
+    r = await api.get("/api/export", headers=PLAIN)
+    assert r.status_code == 200 and r.headers["content-type"] == "application/x-ndjson"
+    assert "content-encoding" not in r.headers
+    lines = parse(r.content)
+    assert [(line["type"], line["data"]["id"]) for line in lines] == [
+        (kind, i) for kind in ("patient", "prescription", "invite") for i in data[kind]
+    ]
+    assert all(line.keys() == {"type", "data"} and "_id" not in line["data"] for line in lines)
+
+
+async def test_chunks_hold_whole_lines(api, memory_server, monkeypatch, data):
+    monkeypatch.setattr(memory_server, "EXPORT_CHUNK_BYTES", 100)
+    owner = (await api.get("/api/me")).json()["id"]
+    chunks = [c async for c in memory_server.iter_export_chunks(owner, False)]
+    assert len(chunks) > 1 and all(c.endswith(b"\n") for c in chunks)
+
+
+async def test_gzip_carries_the_same_lines(api, data):
+    plain = (await api.get("/api/export", headers=PLAIN)).content
+
+    r = await api.get("/api/export", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip" and r.headers["vary"] == "Accept-Encoding"
+    assert r.content == plain  # decoded by httpx
+
+    r = await api.get("/api/export?gzip=true", headers=PLAIN)
+    assert r.headers["content-type"] == "application/gzip" and "content-encoding" not in r.headers
+    assert 'filename="dinutri-export.ndjson.gz"' in r.headers["content-disposition"]
+    assert gzip.decompress(r.content) == plain
+
+    r = await api.get("/api/export", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "content-encoding" not in r.headers and r.content == plain
+
+
+async def test_patients_cannot_export(api, memory_server):
+    token = (await api.post("/api/invites", json={"email": "pat@x.com"})).json()["token"]
+    assert (await api.post(f"/api/invites/{token}/accept", json={"name": "Pat", "password": PASSWORD})).status_code == 200
+    r = await api.post("/api/auth/login", data={"username": "pat@x.com", "password": PASSWORD})
+    patient = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    assert (await api.get("/api/export", headers=patient)).status_code == 403
@@ -0,0 +1,44 @@
+"""FAST_RESPONSES changes how a response is built, never what it says."""
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def both_paths(api, monkeypatch, path):
+    bodies = []
+    for fast in (False, True):
+        monkeypatch.setattr(server, "FAST_RESPONSES", fast)
+        r = await api.get(path)
+        assert r.status_code == 200, path
+        bodies.append(r.content)
+    return bodies
+
+
+async def test_stored_plans_read_the_same_on_both_paths(api, memory_server, monkeypatch):
+    pid = (await api.post("/api/patients", json={"name": "P", "email": "p@x.com"})).json()["id"]
+    body = {"patientId": pid, "title": "Plan", "status": "published", "meals": [
+        {"name": "Lunch", "items": [{"description": "Rice"}, {"description": "Beans", "amount": "100 g"}]},
+        {"name": "Dinner"},
+    ]}
+    plan = (await api.post("/api/prescriptions", json=body)).json()
+    # PUT stores meals and items without their None fields
+    await api.put(f"/api/prescriptions/{plan['id']}", json=body)
+    stored = await memory_server.db.prescriptions.find_one({"id": plan["id"]})
+    assert stored["meals"][0]["items"][0].keys() == {"id", "description"}
+
+    for path in (f"/api/prescriptions/{plan['id']}", f"/api/patients/{pid}/prescriptions",
+                 f"/api/patients/{pid}/prescriptions?limit=5", f"/api/patients/{pid}/latest",
+                 f"/api/patients/{pid}", "/api/patients"):
+        default, fast = await both_paths(api, monkeypatch, path)
+        assert default == fast, path
+
+
+def test_nested_fields_get_their_defaults():
+    shaped = server.shape_doc(server.PrescriptionOut, {
+        "id": "x", "meals": [{"id": "m", "name": "Lunch", "items": [{"id": "i", "description": "Rice", "extra": 1}]}],
+    })
+    assert shaped["meals"][0] == {"id": "m", "name": "Lunch", "notes": None, "items": [
+        {"id": "i", "description": "Rice", "amount": None, "substitutions": None, "foodId": None, "grams": None},
+    ]}
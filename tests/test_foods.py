@@ -0,0 +1,39 @@
+"""Food autocomplete ignores case and accents and ranks earlier words first."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def food_names(api, q, **params):
+    r = await api.get("/api/foods", params={"q": q, **params})
+    assert r.status_code == 200
+    return [food["name"] for food in r.json()]
+
+
+@pytest.mark.parametrize("q", ["pao", "PÃO", "Pão", "pa"])
+async def test_accents_and_case_are_folded(api, q):
+    names = await food_names(api, q)
+    # Every "Pão" first (first word, shortest name first), then later-word matches
+    assert names[:3] == ["Pão, trigo, francês", "Pão, de queijo, assado", "Pão, trigo, forma, integral"]
+
+
+async def test_every_query_word_must_match_a_word_prefix(api):
+    assert await food_names(api, "feijao preto") == ["Feijão, preto, cozido"]
+    assert await food_names(api, "maca FUJI") == ["Maçã, Fuji, com casca, crua"]
+    assert await food_names(api, "acuc") == ["Açúcar, cristal"]
+    assert await food_names(api, "trigo francesa") == []
+    assert await food_names(api, "eijao") == []
+
+
+async def test_limit_and_long_words(api):
+    assert len(await food_names(api, "a", limit=2)) == 2
+    # Words longer than the indexed prefix are checked in full
+    assert await food_names(api, "integralmente") == []
+    assert "Pão, trigo, forma, integral" in await food_names(api, "integral")
+
+
+async def test_food_lookup(api):
+    [food] = (await api.get("/api/foods", params={"q": "acucar"})).json()
+    assert (await api.get(f"/api/foods/{food['id']}")).json() == food
+    assert food["per100g"]["lipidG"] is None  # "NA" in the table
+    assert (await api.get("/api/foods/missing")).status_code == 404
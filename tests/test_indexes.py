@@ -0,0 +1,35 @@
+"""Every hot query in HOT_QUERIES is answered from an index (IXSCAN, no COLLSCAN)."""
+import uuid
+
+import pytest
+
+from tests.conftest import MONGO_TEST_URL
+
+pytestmark = [
+    pytest.mark.anyio,
+    pytest.mark.skipif(not MONGO_TEST_URL, reason="set MONGO_TEST_URL to a mongod to explain query plans"),
+]
+
+
+@pytest.fixture
+async def server():
+    import server
+
+    client = server.connect(server.Settings(mongo_url=MONGO_TEST_URL))
+    previous = server.db.use(client[f"dinutri_test_{uuid.uuid4().hex[:8]}"])
+    yield server
+    await client.drop_database(server.db.name)
+    client.close()
+    server.db.use(previous)
+
+
+async def test_registry_is_created_without_drift(server):
+    first = await server.ensure_indexes()
+    assert all(not r["conflicts"] and not r["unmanaged"] for r in first.values())
+    second = await server.ensure_indexes()
+    assert all(r == {"missing": [], "conflicts": [], "unmanaged": []} for r in second.values())
+
+
+async def test_hot_queries_use_indexes(server):
+    await server.ensure_indexes()
+    assert await server.verify_query_plans() == {}
@@ -0,0 +1,114 @@
+"""Tokens are signed with the active kid and verified against the keyring file as it rotates."""
+import json
+import os
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def keyring(tmp_path, monkeypatch):
+    """Write keyring files and install a JwtKeyring that reloads on every use."""
+    path = tmp_path / "keyring.json"
+    stamp = [1_000_000]
+
+    def write(keys, active, raw=None):
+        path.write_text(raw if raw is not None else json.dumps({"keys": keys, "active": active}))
+        # Each write gets a new mtime even within the filesystem's timestamp resolution
+        stamp[0] += 10
+        os.utime(path, (stamp[0], stamp[0]))
+
+    write({"k1": "s" * 32}, "k1")
+    monkeypatch.setattr(server, "JWT_KEYRING_RELOAD_SECONDS", 0)
+    monkeypatch.setattr(server, "jwt_keys", server.JwtKeyring(str(path)))
+    return write
+
+
+def kid_of(token: str):
+    return jwt.get_unverified_header(token).get("kid")
+
+
+async def assert_rejected(token: str):
+    with pytest.raises(HTTPException) as exc:
+        await server.decode_token(token)
+    assert exc.value.status_code == 401
+
+
+async def test_tokens_carry_the_active_kid(keyring):
+    token = server.create_access_token({"sub": "u1"})
+    assert kid_of(token) == "k1"
+    assert (await server.decode_token(token))["sub"] == "u1"
+
+
+async def test_any_listed_kid_verifies_and_unknown_kids_do_not(keyring):
+    keyring({"k1": "s" * 32, "k2": "t" * 32}, "k1")
+    listed = jwt.encode({"sub": "u1"}, "t" * 32, algorithm=server.JWT_ALGO, headers={"kid": "k2"})
+    assert (await server.decode_token(listed))["sub"] == "u1"
+    await assert_rejected(jwt.encode({"sub": "u1"}, "t" * 32, algorithm=server.JWT_ALGO, headers={"kid": "k9"}))
+    # A listed kid with another key's signature is not tried against the rest
+    await assert_rejected(jwt.encode({"sub": "u1"}, "s" * 32, algorithm=server.JWT_ALGO, headers={"kid": "k2"}))
+
+
+async def test_tokens_without_kid_try_every_key(keyring):
+    keyring({"k1": "s" * 32, "k2": "t" * 32}, "k1")
+    for secret in ("s" * 32, "t" * 32):
+        legacy = jwt.encode({"sub": "u1"}, secret, algorithm=server.JWT_ALGO)
+        assert kid_of(legacy) is None
+        assert (await server.decode_token(legacy))["sub"] == "u1"
+    await assert_rejected(jwt.encode({"sub": "u1"}, "u" * 32, algorithm=server.JWT_ALGO))
+
+
+async def test_rotation(keyring):
+    old = server.create_access_token({"sub": "u1"})
+
+    # New key becomes active; the old one stays listed while its tokens are live
+    keyring({"k1": "s" * 32, "k2": "t" * 32}, "k2")
+    new = server.create_access_token({"sub": "u1"})
+    assert kid_of(new) == "k2"
+    assert (await server.decode_token(old))["sub"] == "u1"
+    assert (await server.decode_token(new))["sub"] == "u1"
+
+    # Retiring the old key revokes what it signed
+    keyring({"k2": "t" * 32}, "k2")
+    await assert_rejected(old)
+    assert (await server.decode_token(new))["sub"] == "u1"
+
+
+@pytest.mark.parametrize("raw", [
+    '{"keys": {"k2": "t',                       # half-written
+    '{"keys": {}, "active": "k2"}',             # no keys
+    '{"keys": {"k2": "tttt"}, "active": "k3"}',  # active not listed
+    '{"keys": {"k2": ""}, "active": "k2"}',      # empty secret
+])
+async def test_malformed_file_keeps_last_good_keys(keyring, raw):
+    token = server.create_access_token({"sub": "u1"})
+    keyring(None, None, raw=raw)
+    assert kid_of(server.create_access_token({"sub": "u1"})) == "k1"
+    assert (await server.decode_token(token))["sub"] == "u1"
+
+    # The next good write is picked up
+    keyring({"k2": "t" * 32}, "k2")
+    assert kid_of(server.create_access_token({"sub": "u1"})) == "k2"
+    await assert_rejected(token)
+
+
+def test_random_secret_needs_the_dev_flag(monkeypatch):
+    monkeypatch.delenv("JWT_SECRET", raising=False)
+    monkeypatch.setattr(server, "JWT_KEYRING_FILE", None)
+    monkeypatch.setattr(server, "JWT_ALLOW_RANDOM_SECRET", False)
+    with pytest.raises(RuntimeError, match="JWT_ALLOW_RANDOM_SECRET"):
+        server.Settings(mongo_url="mongodb://x", web_concurrency=1).check()
+
+    monkeypatch.setattr(server, "JWT_ALLOW_RANDOM_SECRET", True)
+    server.Settings(mongo_url="mongodb://x", web_concurrency=1).check()
+    with pytest.raises(RuntimeError, match="several workers"):
+        server.Settings(mongo_url="mongodb://x", web_concurrency=2).check()
+
+    monkeypatch.setenv("JWT_SECRET", "s" * 32)
+    monkeypatch.setattr(server, "JWT_ALLOW_RANDOM_SECRET", False)
+    server.Settings(mongo_url="mongodb://x", web_concurrency=4).check()
@@ -0,0 +1,81 @@
+"""SingleFlightCache never hands out a value read before an invalidate()."""
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+class SlowStore:
+    """A loader whose reads block until released, so tests can interleave writes."""
+
+    def __init__(self, value):
+        self.value = value
+        self.reads = 0
+        self.gates = []
+
+    async def load(self, key):
+        self.reads += 1
+        seen = self.value
+        gate = asyncio.Event()
+        self.gates.append(gate)
+        await gate.wait()
+        return seen
+
+    async def wait_reads(self, n):
+        while len(self.gates) < n:
+            await asyncio.sleep(0)
+
+    def release_all(self):
+        for gate in self.gates:
+            gate.set()
+
+
+async def test_concurrent_misses_share_one_load():
+    store = SlowStore("v1")
+    cache = server.SingleFlightCache(store.load, 10, 60)
+    readers = [asyncio.ensure_future(cache.get("k")) for _ in range(5)]
+    await store.wait_reads(1)
+    store.release_all()
+    assert await asyncio.gather(*readers) == ["v1"] * 5
+    assert store.reads == 1
+    assert await cache.get("k") == "v1"
+    assert store.reads == 1
+
+
+async def test_read_after_invalidate_does_not_join_stale_load():
+    store = SlowStore("old")
+    cache = server.SingleFlightCache(store.load, 10, 60)
+    before = asyncio.ensure_future(cache.get("k"))
+    await store.wait_reads(1)  # the load has read "old" and is waiting
+
+    store.value = "new"
+    cache.invalidate("k")
+    after = asyncio.ensure_future(cache.get("k"))
+    await store.wait_reads(2)
+    store.release_all()
+
+    assert await before == "old"
+    assert await after == "new"
+    assert store.reads == 2
+
+
+async def test_detached_load_does_not_store_its_result():
+    store = SlowStore("old")
+    cache = server.SingleFlightCache(store.load, 10, 60)
+    stale = asyncio.ensure_future(cache.get("k"))
+    await store.wait_reads(1)
+    store.value = "new"
+    cache.invalidate("k")
+    fresh = asyncio.ensure_future(cache.get("k"))
+    await store.wait_reads(2)
+
+    # The fresh load finishes first and caches; the detached one must not overwrite it
+    store.gates[1].set()
+    assert await fresh == "new"
+    store.gates[0].set()
+    assert await stale == "old"
+    assert await cache.get("k") == "new"
+    assert cache.stats()["inflight"] == 0
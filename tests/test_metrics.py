@@ -0,0 +1,55 @@
+"""/metrics reports what requests and Mongo commands did, counted exactly under concurrency."""
+import contextvars
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def scrape(api) -> dict:
+    r = await api.get("/metrics")
+    assert r.status_code == 200
+    return dict(line.rsplit(" ", 1) for line in r.text.splitlines() if not line.startswith("#"))
+
+
+async def test_requests_and_their_db_use_are_reported(api, memory_server):
+    labels = 'method="GET",route="/api/patients"'
+    before = await scrape(api)
+    for _ in range(2):
+        assert (await api.get("/api/patients")).status_code == 200
+    after = await scrape(api)
+
+    def delta(name):
+        return float(after[name]) - float(before.get(name, 0))
+
+    assert delta(f'dinutri_http_requests_total{{{labels},status="200"}}') == 2
+    assert delta(f"dinutri_http_request_db_commands_count{{{labels}}}") == 2
+    # Each list reads the patients once
+    assert delta(f"dinutri_http_request_db_commands_sum{{{labels}}}") >= 2
+
+
+async def test_commands_from_many_threads_are_all_counted(api, memory_server):
+    stats = memory_server.RequestDbStats()
+    token = memory_server.current_request_db.set(stats)
+    try:
+        context = contextvars.copy_context()
+    finally:
+        memory_server.current_request_db.reset(token)
+    event = SimpleNamespace(command_name="metrics_test", duration_micros=10)
+    name = 'dinutri_mongo_commands_total{command="metrics_test"}'
+    before = int((await scrape(api)).get(name, 0))
+
+    def run():
+        for _ in range(5000):
+            context.copy().run(memory_server.command_metrics.succeeded, event)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert stats.commands == 40000
+    assert int((await scrape(api))[name]) - before == 40000
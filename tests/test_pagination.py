@@ -0,0 +1,59 @@
+"""Keyset cursors walk every row exactly once, even when createdAt ties."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+CREATED = "2024-05-01T12:00:00+00:00"
+
+
+async def walk(api, path, limit):
+    seen, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        page = (await api.get(path, params=params)).json()
+        assert len(page["items"]) <= limit
+        seen += [row["id"] for row in page["items"]]
+        cursor = page["nextCursor"]
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 50])
+async def test_patient_pages_with_tied_created_at(api, memory_server, limit):
+    owner = (await api.get("/api/me")).json()["id"]
+    # Two timestamps shared by several rows each, so pages split inside a tie
+    rows = [
+        {"id": f"p{i:02d}", "ownerId": owner, "name": f"P{i}", "email": f"p{i}@x.com",
+         "createdAt": CREATED if i % 3 else "2024-05-02T08:00:00+00:00", "updatedAt": CREATED}
+        for i in range(10)
+    ]
+    await memory_server.db.patients.insert_many(rows)
+    expected = [r["id"] for r in sorted(rows, key=lambda r: (r["createdAt"], r["id"]), reverse=True)]
+    assert await walk(api, "/api/patients", limit) == expected
+
+
+async def test_prescription_pages_with_tied_created_at(api, memory_server):
+    pid = (await api.post("/api/patients", json={"name": "P", "email": "p@x.com"})).json()["id"]
+    plan = (await api.post("/api/prescriptions", json={"patientId": pid, "title": "T", "meals": []})).json()
+    ids = [(await api.post(f"/api/prescriptions/{plan['id']}/duplicate")).json()["id"] for _ in range(4)]
+    await memory_server.db.prescriptions.update_many({}, {"$set": {"createdAt": CREATED}})
+    for path in (f"/api/patients/{pid}/prescriptions", f"/api/patients/{pid}/prescriptions/summary"):
+        assert await walk(api, path, 2) == sorted(ids + [plan["id"]], reverse=True)
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4])
+async def test_invites_without_created_at_come_last(api, memory_server, limit):
+    owner = (await api.get("/api/me")).json()["id"]
+    # Legacy invites may have a null or missing createdAt
+    dated = [{"id": f"d{i}", "createdAt": CREATED} for i in range(3)]
+    undated = [{"id": "n0", "createdAt": None}, {"id": "n1"}, {"id": "n2", "createdAt": None}]
+    await memory_server.db.invites.insert_many([
+        {**row, "nutritionistId": owner, "token": row["id"], "email": f"{row['id']}@x.com", "status": "active"}
+        for row in dated + undated
+    ])
+    assert await walk(api, "/api/invites", limit) == ["d2", "d1", "d0", "n2", "n1", "n0"]
+
+
+async def test_malformed_cursor_is_rejected(api):
+    r = await api.get("/api/patients", params={"limit": 2, "cursor": "not-a-cursor"})
+    assert r.status_code == 400
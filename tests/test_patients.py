@@ -0,0 +1,26 @@
+"""PUT /patients answers with the stored patient, and only its owner may write it."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_update_returns_the_stored_patient(api):
+    pid = (await api.post("/api/patients", json={"name": "Ana", "email": "ana@x.com", "notes": "gluten"})).json()["id"]
+    r = await api.put(f"/api/patients/{pid}", json={"name": "Ana Souza", "email": "ana@x.com", "phone": "1234"})
+    assert r.status_code == 200
+    # Notes left out keep their stored value
+    assert r.json()["notes"] == "gluten" and r.json()["name"] == "Ana Souza"
+    assert r.json() == (await api.get(f"/api/patients/{pid}")).json()
+
+
+async def test_update_of_a_missing_patient_is_404(api):
+    r = await api.put("/api/patients/missing", json={"name": "X", "email": "x@x.com"})
+    assert r.status_code == 404
+
+
+async def test_update_of_someone_elses_patient_is_403(api, memory_server):
+    theirs = {"id": "theirs", "ownerId": "someone-else", "name": "Theirs", "email": "t@x.com"}
+    await memory_server.db.patients.insert_one(dict(theirs))
+    r = await api.put("/api/patients/theirs", json={"name": "Mine now", "email": "t@x.com"})
+    assert r.status_code == 403
+    assert (await memory_server.db.patients.find_one({"id": "theirs"}, {"_id": 0})) == theirs
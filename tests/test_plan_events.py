@@ -0,0 +1,122 @@
+"""The plan event stream, driven as raw ASGI (httpx's ASGITransport buffers whole bodies)."""
+import asyncio
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class EventStream:
+    """One GET on the app, reading the streamed body as it is sent."""
+
+    def __init__(self, app, path: str, headers: dict):
+        self.app = app
+        self.scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in {"host": "test", **headers}.items()],
+            "client": ("127.0.0.1", 50000), "server": ("test", 80),
+        }
+        self.status = None
+        self.text = ""
+        self._chunks: asyncio.Queue = asyncio.Queue()
+        self._gone = asyncio.Event()
+        self._requested = False
+
+    async def _receive(self):
+        if not self._requested:
+            self._requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self._gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            if self._gone.is_set():
+                await asyncio.sleep(0.2)  # a slow socket: the disconnect is seen meanwhile
+        elif message["type"] == "http.response.body":
+            await self._chunks.put(message.get("body", b"").decode())
+
+    async def __aenter__(self):
+        self.task = asyncio.ensure_future(self.app(self.scope, self._receive, self._send))
+        return self
+
+    async def __aexit__(self, *exc):
+        self._gone.set()
+        await asyncio.wait_for(self.task, 5)
+
+    async def read_until(self, marker: str, timeout: float = 5) -> str:
+        while marker not in self.text:
+            self.text += await asyncio.wait_for(self._chunks.get(), timeout)
+        return self.text
+
+    def events(self) -> list:
+        out = []
+        for block in self.text.split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.splitlines() if line and not line.startswith(":"))
+            if "event" in fields:
+                out.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+        return out
+
+
+@pytest.fixture
+async def plan(api):
+    pid = (await api.post("/api/patients", json={"name": "P", "email": "p@x.com"})).json()["id"]
+    return pid, {"patientId": pid, "title": "Plan", "meals": []}
+
+
+def stream(memory_server, api, pid, **headers):
+    auth = {"Authorization": api.headers["Authorization"]}
+    return EventStream(memory_server.app, f"/api/patients/{pid}/events", {**auth, **headers})
+
+
+async def test_publish_and_unpublish_reach_subscribers(api, memory_server, plan):
+    pid, body = plan
+    async with stream(memory_server, api, pid) as es:
+        await es.read_until("retry:")
+        assert es.status == 200 and memory_server.plan_events.connections == 1
+        created = (await api.post("/api/prescriptions", json={**body, "status": "published"})).json()
+        await es.read_until("event: published")
+        await api.post("/api/prescriptions", json=body)  # a draft changes nothing
+        await api.put(f"/api/prescriptions/{created['id']}", json=body)  # back to draft
+        await es.read_until("event: unpublished")
+        assert (await api.get(f"/api/patients/{pid}/latest")).json() is None
+    assert [(e, d["id"], d["status"]) for _, e, d in es.events()] == [
+        ("published", created["id"], "published"), ("unpublished", created["id"], "draft"),
+    ]
+    assert memory_server.plan_events.connections == 0
+
+
+async def test_heartbeat(api, memory_server, monkeypatch, plan):
+    monkeypatch.setattr(memory_server, "SSE_HEARTBEAT_SECONDS", 0.05)
+    async with stream(memory_server, api, plan[0]) as es:
+        text = await es.read_until(": ping\n\n: ping\n\n")
+    assert text.startswith("retry: 50\n\n")
+
+
+async def test_last_event_id_replays_what_was_missed(api, memory_server, plan):
+    pid, body = plan
+    async with stream(memory_server, api, pid) as es:
+        await es.read_until("retry:")  # subscribed
+        for title in ("One", "Two"):
+            await api.post("/api/prescriptions", json={**body, "title": title, "status": "published"})
+        await es.read_until("Two")
+    (first, _, _), (second, _, _) = es.events()
+
+    async with stream(memory_server, api, pid, **{"Last-Event-ID": str(first)}) as es:
+        await es.read_until("Two")
+    assert [(i, d["title"]) for i, _, d in es.events()] == [(second, "Two")]
+
+    async with stream(memory_server, api, pid, **{"Last-Event-ID": "1"}) as es:
+        await es.read_until("event: resync")
+
+
+async def test_client_gone_before_the_body_leaves_no_subscriber(api, memory_server, plan):
+    es = stream(memory_server, api, plan[0])
+    es._gone.set()  # disconnects while the headers are being sent
+    async with es:
+        pass
+    assert es.status == 200 and es.text == ""
+    assert memory_server.plan_events.connections == 0
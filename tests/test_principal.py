@@ -0,0 +1,28 @@
+"""get_current_principal trusts token claims only when they say everything routes need."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def trusting(memory_server, monkeypatch):
+    monkeypatch.setattr(memory_server, "TRUST_JWT_CLAIMS", True)
+    await memory_server.db.users.insert_one({"id": "u-pat", "role": "patient", "patientId": "p1"})
+    return memory_server
+
+
+async def test_full_claims_skip_the_user_lookup(trusting):
+    await trusting.db.users.delete_many({})
+    token = trusting.create_access_token({"sub": "u-pat", "role": "patient", "patientId": "p1"})
+    assert await trusting.get_current_principal(token) == {"id": "u-pat", "role": "patient", "patientId": "p1"}
+
+
+async def test_patient_token_without_patient_id_reads_the_user(trusting):
+    token = trusting.create_access_token({"sub": "u-pat", "role": "patient"})
+    principal = await trusting.get_current_principal(token)
+    assert (principal["id"], principal["patientId"]) == ("u-pat", "p1")
+
+
+async def test_token_without_role_reads_the_user(trusting):
+    token = trusting.create_access_token({"sub": "u-pat"})
+    assert (await trusting.get_current_principal(token))["role"] == "patient"
@@ -0,0 +1,153 @@
+"""Every budgeted route stays within its Mongo round-trip budget as the data
+behind it grows, which is how an N+1 query shows up."""
+import uuid
+
+import httpx
+import pytest
+
+from tests.conftest import MONGO_TEST_URL
+
+pytestmark = pytest.mark.anyio
+needs_mongod = pytest.mark.skipif(not MONGO_TEST_URL, reason="set MONGO_TEST_URL to a mongod to count real round trips")
+
+PASSWORD = "password123"
+
+
+@pytest.fixture
+async def server():
+    import server
+
+    server.QUERY_BUDGET_STRICT = True
+    client = server.connect(server.Settings(mongo_url=MONGO_TEST_URL))
+    previous = server.db.use(client[f"dinutri_test_{uuid.uuid4().hex[:8]}"])
+    server.user_cache.clear()
+    await server.ensure_indexes()
+    yield server
+    await client.drop_database(server.db.name)
+    client.close()
+    server.db.use(previous)
+
+
+def plan(server, patient_id: str, owner_id: str, i: int) -> dict:
+    now = server.now_iso()
+    return {
+        "id": str(uuid.uuid4()),
+        "patientId": patient_id,
+        "nutritionistId": owner_id,
+        "ownerId": owner_id,
+        "title": f"Plan {i}",
+        "status": "published" if i % 2 else "draft",
+        "meals": [
+            {"id": str(uuid.uuid4()), "name": f"Meal {m}", "notes": None, "items": [
+                {"id": str(uuid.uuid4()), "description": f"Food {k}", "amount": "100 g", "substitutions": []}
+                for k in range(4)
+            ]}
+            for m in range(5)
+        ],
+        "generalNotes": None,
+        "publishedAt": now if i % 2 else None,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+
+
+async def seed(server, rows: int) -> dict:
+    now = server.now_iso()
+    owner = {
+        "id": str(uuid.uuid4()),
+        "role": "nutritionist",
+        "name": "Budget Nutritionist",
+        "email": "budget@test.dinutri.app",
+        "passwordHash": server.get_password_hash(PASSWORD),
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    await server.db.users.insert_one(owner)
+    patients = [
+        {"id": str(uuid.uuid4()), "ownerId": owner["id"], "name": f"Patient {i}",
+         "email": f"p{i}@test.dinutri.app", "createdAt": server.now_iso(), "updatedAt": server.now_iso()}
+        for i in range(rows)
+    ]
+    await server.db.patients.insert_many(patients)
+    plans = [plan(server, patients[0]["id"], owner["id"], i) for i in range(rows)]
+    await server.db.prescriptions.insert_many(plans)
+    await server.db.invites.insert_many([
+        {"id": str(uuid.uuid4()), "nutritionistId": owner["id"], "token": str(uuid.uuid4()),
+         "email": f"invite{i}@test.dinutri.app", "status": "active", "createdAt": server.now_iso(), "expiresAt": None}
+        for i in range(rows)
+    ])
+    return {"owner": owner, "patients": patients, "plans": plans}
+
+
+@needs_mongod
+@pytest.mark.parametrize("rows", [10, 100, 1000])
+async def test_routes_stay_within_query_budget(server, rows):
+    await walk_routes(server, rows)
+
+
+@pytest.mark.parametrize("rows", [10, 100])
+async def test_routes_stay_within_query_budget_in_memory(memory_server, rows):
+    # One round trip per operation here, so this catches N+1s, not getMores
+    await walk_routes(memory_server, rows)
+
+
+async def walk_routes(server, rows: int):
+    data = await seed(server, rows)
+    patient_id = data["patients"][0]["id"]
+    plan_id = data["plans"][0]["id"]
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as cl:
+        r = await cl.post("/api/auth/login", data={"username": data["owner"]["email"], "password": PASSWORD})
+        assert r.status_code == 200
+        auth = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        reads = [
+            "/api/me",
+            "/api/patients",
+            "/api/patients?limit=50",
+            f"/api/patients/{patient_id}",
+            f"/api/patients/{patient_id}/prescriptions",
+            f"/api/patients/{patient_id}/prescriptions?limit=50",
+            f"/api/patients/{patient_id}/prescriptions/summary",
+            f"/api/patients/{patient_id}/latest",
+            f"/api/prescriptions/{plan_id}",
+            "/api/invites",
+            "/api/invites?limit=50",
+            "/api/dashboard",
+            "/api/dashboard?live=true",
+            "/api/search?q=patient",
+            "/api/search?q=food+plan&type=prescription",
+        ]
+        for path in reads:
+            r = await cl.get(path, headers=auth)
+            assert r.status_code == 200, path
+            if "etag" in r.headers:
+                r = await cl.get(path, headers={**auth, "If-None-Match": r.headers["etag"]})
+                assert r.status_code == 304, path
+
+        r = await cl.post(f"/api/patients/{patient_id}/events/token", headers=auth)
+        assert r.status_code == 200
+        r = await cl.put(f"/api/patients/{patient_id}", json={"name": "Renamed", "email": "p0@test.dinutri.app"}, headers=auth)
+        assert r.status_code == 200
+        body = {"patientId": patient_id, "title": "New plan", "meals": [{"name": "Lunch", "items": [{"description": "Rice"}]}]}
+        r = await cl.post("/api/prescriptions", json=body, headers=auth)
+        assert r.status_code == 200
+        new_id = r.json()["id"]
+        assert (await cl.put(f"/api/prescriptions/{new_id}", json=body, headers=auth)).status_code == 200
+        assert (await cl.post(f"/api/prescriptions/{new_id}/publish", headers=auth)).status_code == 200
+        assert (await cl.post(f"/api/prescriptions/{new_id}/duplicate", headers=auth)).status_code == 200
+        r = await cl.post(
+            f"/api/prescriptions/{new_id}/fan-out",
+            json={"patientIds": [p["id"] for p in data["patients"]]},
+            headers=auth,
+        )
+        assert r.status_code == 200 and r.json()["created"] == rows
+
+        r = await cl.post("/api/invites", json={"email": "new@test.dinutri.app"}, headers=auth)
+        assert r.status_code == 200
+        invite = r.json()
+        assert (await cl.get(f"/api/invites/{invite['token']}")).status_code == 200
+        r = await cl.post(f"/api/invites/{invite['token']}/accept", json={"name": "New", "password": PASSWORD})
+        assert r.status_code == 200
+        r = await cl.post("/api/invites", json={"email": "other@test.dinutri.app"}, headers=auth)
+        assert (await cl.post(f"/api/invites/{r.json()['id']}/revoke", headers=auth)).status_code == 200
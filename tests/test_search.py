@@ -0,0 +1,60 @@
+"""Search matches word prefixes without accents and ranks by field weight."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def panel(api):
+    patients = [
+        {"name": "Ana Souza", "email": "ana@x.com"},
+        {"name": "Mariana Lima", "email": "mari@x.com", "notes": "Ana indicou"},
+        {"name": "Bruno Anastácio", "email": "bruno@x.com"},
+        {"name": "Carla Dias", "email": "ana.carla@x.com"},
+    ]
+    ids = {p["name"]: (await api.post("/api/patients", json=p)).json()["id"] for p in patients}
+    plan = {"patientId": ids["Ana Souza"], "title": "Dieta da Ana",
+            "meals": [{"name": "Almoço", "items": [{"description": "Feijão com arroz"}]}]}
+    ids["plan"] = (await api.post("/api/prescriptions", json=plan)).json()["id"]
+    return ids
+
+
+async def hits(api, q, **params):
+    r = await api.get("/api/search", params={"q": q, **params})
+    assert r.status_code == 200
+    return [(h.get("name") or h["title"], h["score"]) for h in r.json()]
+
+
+async def test_field_weights_and_whole_words(api, panel):
+    # Weights: name or title 3, email 2, notes or meal items 1; doubled when
+    # the whole word matches. Ties go by name.
+    assert await hits(api, "ana") == [
+        ("Ana Souza", 6),        # name, whole word
+        ("Dieta da Ana", 6),     # title, whole word
+        ("Carla Dias", 4),       # email "ana.carla", whole word
+        ("Bruno Anastácio", 3),  # name, prefix
+        ("Mariana Lima", 2),     # notes, whole word; "mariana" does not start with it
+    ]
+
+
+async def test_accent_insensitive_and_every_word_required(api, panel):
+    assert await hits(api, "ANASTACIO") == [("Bruno Anastácio", 6)]
+    assert await hits(api, "feijao arroz") == [("Dieta da Ana", 2 + 2)]
+    assert await hits(api, "ana lima") == [("Mariana Lima", 2 + 6)]
+    assert await hits(api, "ana zzz") == []
+    assert await hits(api, "a") == []  # shorter than SEARCH_PREFIX_MIN
+
+
+async def test_type_filter_and_limit(api, panel):
+    assert await hits(api, "ana", type="prescription") == [("Dieta da Ana", 6)]
+    assert len(await hits(api, "ana", limit=2)) == 2
+
+
+async def test_edits_update_the_keys(api, panel):
+    pid = panel["Mariana Lima"]
+    await api.put(f"/api/patients/{pid}", json={"name": "Mariana Lima", "email": "mari@x.com"})
+    # Notes left out of the update keep their keys
+    assert await hits(api, "ana indicou") == [("Mariana Lima", 2 + 2)]
+    await api.put(f"/api/patients/{pid}", json={"name": "Mariana Souza", "email": "mari@x.com", "notes": "nova"})
+    assert await hits(api, "indicou") == []
+    assert await hits(api, "souza") == [("Ana Souza", 6), ("Mariana Souza", 6)]
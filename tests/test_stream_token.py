@@ -0,0 +1,57 @@
+"""Event streams take ?access_token= only as a short-lived, per-patient stream token."""
+import pytest
+from fastapi import HTTPException
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def patients(api):
+    return [(await api.post("/api/patients", json={"name": f"P{i}", "email": f"p{i}@x.com"})).json()["id"]
+            for i in range(2)]
+
+
+async def stream_token(api, patient_id):
+    r = await api.post(f"/api/patients/{patient_id}/events/token")
+    assert r.status_code == 200
+    return r.json()
+
+
+async def assert_unauthorized(server, patient_id, access_token):
+    with pytest.raises(HTTPException) as exc:
+        await server.get_stream_principal(patient_id, access_token=access_token, token=None)
+    assert exc.value.status_code == 401
+
+
+async def test_stream_token_opens_only_its_patients_stream(api, memory_server, patients):
+    body = await stream_token(api, patients[0])
+    assert body["expires_in"] == memory_server.SSE_TOKEN_TTL_SECONDS
+    principal = await memory_server.get_stream_principal(patients[0], access_token=body["access_token"], token=None)
+    assert principal["role"] == "nutritionist"
+    await assert_unauthorized(memory_server, patients[1], body["access_token"])
+
+
+async def test_login_token_is_refused_in_the_query(api, memory_server, patients):
+    login_token = api.headers["Authorization"].removeprefix("Bearer ")
+    await assert_unauthorized(memory_server, patients[0], login_token)
+    # The header still takes the login token
+    principal = await memory_server.get_stream_principal(patients[0], access_token=None, token=login_token)
+    assert principal["role"] == "nutritionist"
+
+
+async def test_stream_token_is_refused_elsewhere(api, patients):
+    token = (await stream_token(api, patients[0]))["access_token"]
+    r = await api.get("/api/patients", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 401
+
+
+async def test_stream_token_expires(api, memory_server, monkeypatch, patients):
+    monkeypatch.setattr(memory_server, "SSE_TOKEN_TTL_SECONDS", -1)
+    token = (await stream_token(api, patients[0]))["access_token"]
+    await assert_unauthorized(memory_server, patients[0], token)
+
+
+async def test_token_needs_access_to_the_patient(api, memory_server):
+    await memory_server.db.patients.insert_one({"id": "theirs", "ownerId": "someone-else", "name": "X"})
+    assert (await api.post("/api/patients/theirs/events/token")).status_code == 403
+    assert (await api.post("/api/patients/missing/events/token")).status_code == 404
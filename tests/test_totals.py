@@ -0,0 +1,72 @@
+"""Nutrient totals against hand-computed sums, and their ETags follow the food table."""
+import pytest
+
+import server
+
+# per 100 g: kcal, protein, carbohydrate, lipid, fiber
+FOODS = [
+    {"id": "rice", "name": "Arroz", "energy_kcal": "128", "protein_g": "2,5", "carbohydrate_g": "28",
+     "lipid_g": "0.2", "fiber_g": "1.6"},
+    {"id": "egg", "name": "Ovo", "energy_kcal": "146", "protein_g": "13.3", "carbohydrate_g": "0.6",
+     "lipid_g": "9.5", "fiber_g": "NA"},
+    {"id": "oil", "name": "Azeite", "energy_kcal": "884", "protein_g": "Tr", "carbohydrate_g": "0",
+     "lipid_g": "100", "fiber_g": ""},
+]
+
+
+@pytest.fixture
+def foods(monkeypatch):
+    monkeypatch.setattr(server, "_food_index", server.FoodIndex(FOODS))
+    server.nutrient_cache.clear()
+    yield
+    server.nutrient_cache.clear()
+
+
+def plan(pid, *meals):
+    return {"id": pid, "updatedAt": "2024-01-01T00:00:00+00:00",
+            "meals": [{"id": f"m{i}", "items": items} for i, items in enumerate(meals)]}
+
+
+def test_meal_and_plan_sums(foods):
+    lunch = [{"foodId": "rice", "grams": 150}, {"foodId": "oil", "amount": "10 g"}]
+    breakfast = [{"foodId": "egg", "amount": "0,1 kg"}]
+    [totals] = server.compute_totals([plan("p1", lunch, breakfast)])
+    # rice 150 g: 192 kcal, 3.75 P, 42 C, 0.3 L, 2.4 F; oil 10 g: 88.4 kcal, 10 L
+    assert totals["meals"][0] == {"mealId": "m0", "energyKcal": 280.4, "proteinG": 3.8,
+                                  "carbohydrateG": 42.0, "lipidG": 10.3, "fiberG": 2.4}
+    # egg 100 g; fiber not analysed counts as zero
+    assert totals["meals"][1] == {"mealId": "m1", "energyKcal": 146.0, "proteinG": 13.3,
+                                  "carbohydrateG": 0.6, "lipidG": 9.5, "fiberG": 0.0}
+    assert totals["plan"] == {"energyKcal": 426.4, "proteinG": 17.1, "carbohydrateG": 42.6,
+                              "lipidG": 19.8, "fiberG": 2.4}
+    assert totals["unresolvedItems"] == 0
+
+
+def test_unresolved_items_and_empty_plans(foods):
+    items = [{"foodId": "egg", "grams": 50}, {"foodId": "unknown", "grams": 10},
+             {"foodId": "rice", "amount": "1 xícara"}, {"description": "free text"}]
+    one, empty = server.compute_totals([plan("p1", items), plan("p2")])
+    assert one["plan"]["energyKcal"] == 73.0 and one["unresolvedItems"] == 3
+    assert empty == {"meals": [], "plan": dict.fromkeys(one["plan"], 0.0), "unresolvedItems": 0}
+    assert server.compute_totals([]) == []
+
+
+def test_totals_are_floats_when_nothing_resolves(foods):
+    [totals] = server.compute_totals([plan("p1", [{"foodId": "unknown", "grams": 10}], [])])
+    values = [*totals["plan"].values()] + [v for meal in totals["meals"] for k, v in meal.items() if k != "mealId"]
+    assert len(values) == 15 and all(type(v) is float for v in values)
+
+
+def test_batch_matches_one_by_one(foods):
+    plans = [plan(f"p{i}", [{"foodId": "rice", "grams": 10 * i}], [{"foodId": "egg", "grams": i}]) for i in range(5)]
+    assert server.compute_totals(plans) == [server.compute_totals([p])[0] for p in plans]
+
+
+def test_cached_totals_and_etags_follow_the_food_table(foods, monkeypatch):
+    p = plan("p1", [{"foodId": "egg", "grams": 100}])
+    before = server.plans_totals([p])[0]["plan"]["energyKcal"]
+    tag = server.etag_for([p], server.plan_variant())
+
+    monkeypatch.setattr(server, "_food_index", server.FoodIndex([{**FOODS[1], "energy_kcal": "155"}]))
+    assert (before, server.plans_totals([p])[0]["plan"]["energyKcal"]) == (146.0, 155.0)
+    assert server.etag_for([p], server.plan_variant()) != tag
@@ -0,0 +1,61 @@
+"""Authenticated requests read the caller's user through user_cache."""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def user_reads(memory_server, monkeypatch):
+    """Ids of the users read from the database, in order."""
+    import mongomock_motor
+
+    reads = []
+    find_one = mongomock_motor.AsyncMongoMockCollection.find_one
+
+    async def counted(coll, flt=None, *args, **kwargs):
+        if coll.name == "users" and set(flt or ()) == {"id"}:
+            reads.append(flt["id"])
+        return await find_one(coll, flt, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "find_one", counted)
+    return reads
+
+
+async def me(api):
+    r = await api.get("/api/me")
+    return r.status_code, r.json()
+
+
+async def test_second_request_is_served_from_the_cache(api, memory_server, user_reads):
+    memory_server.user_cache.clear()
+    first, second = await me(api), await me(api)
+    assert first == second and first[0] == 200
+    assert user_reads == [first[1]["id"]]
+
+
+async def test_entries_expire(api, memory_server, monkeypatch, user_reads):
+    monkeypatch.setattr(memory_server.user_cache.current(), "ttl", -1)
+    memory_server.user_cache.clear()
+    for _ in range(3):
+        await me(api)
+    assert len(user_reads) == 3
+
+
+async def test_invalidate_after_an_update_or_delete(api, memory_server):
+    user_id = (await me(api))[1]["id"]
+    await memory_server.db.users.update_one({"id": user_id}, {"$set": {"name": "Renamed"}})
+    # Until invalidated, the cached user is served for up to USER_CACHE_TTL_SECONDS
+    assert (await me(api))[1]["name"] == "Pro Nutritionist"
+    memory_server.invalidate_user(user_id)
+    assert (await me(api))[1]["name"] == "Renamed"
+
+    await memory_server.db.users.delete_one({"id": user_id})
+    memory_server.invalidate_user(user_id)
+    assert (await api.get("/api/me")).status_code == 401
+
+
+async def test_callers_cannot_change_the_cached_user(api, memory_server):
+    user_id = (await me(api))[1]["id"]
+    user = await memory_server.user_from_payload({"sub": user_id})
+    user["role"] = "patient"
+    assert (await memory_server.user_from_payload({"sub": user_id}))["role"] == "nutritionist"